@@ -13,6 +13,10 @@ CREATE TABLE pois (
   website text,
   phone text,
   poi_roles poi_role[],
+  -- Themes of categories via theme_category_map (see pois_set_themes)
+  themes theme_key[] NOT NULL DEFAULT ARRAY[]::theme_key[],
+  -- Weighted full-text document for rpc_search_pois (see pois_set_search_doc)
+  search_doc tsvector,
 
   timezone text,
   open_hours jsonb,
@@ -24,6 +28,8 @@ CREATE TABLE pois (
   latitude double precision,
   longitude double precision,
   geom GEOGRAPHY(POINT, 4326),
+  -- Most specific admin area containing geom (see poi_admin_area)
+  admin_area_id uuid,
   complete_address jsonb,
 
   descriptions text,
@@ -44,7 +50,11 @@ CREATE TABLE pois (
   halal_food boolean DEFAULT false,
   vegan_options boolean DEFAULT false,
   vegetarian_options boolean DEFAULT false,
-  reservations_required boolean DEFAULT false
+  reservations_required boolean DEFAULT false,
+
+  -- Loader bookkeeping (load_pois.py --delta / --prune mark)
+  content_hash text,
+  missing_since timestamptz
 );
 
 CREATE OR REPLACE FUNCTION pois_set_geom()
@@ -53,11 +63,23 @@ LANGUAGE plpgsql
 SET search_path = public
 AS $$
 BEGIN
+  -- Bulk loads defer this to recompute_poi_derived()
+  IF current_setting('fika.defer_poi_triggers', true) = 'on' THEN
+    RETURN NEW;
+  END IF;
+
   IF NEW.longitude IS NOT NULL AND NEW.latitude IS NOT NULL THEN
     NEW.geom := ST_SetSRID(ST_MakePoint(NEW.longitude, NEW.latitude), 4326)::geography;
   ELSE
     NEW.geom := NULL;
   END IF;
+
+  -- POIs loaded after 20_link_admin_areas.sql get their area here
+  IF TG_OP = 'INSERT'
+     OR NEW.latitude IS DISTINCT FROM OLD.latitude
+     OR NEW.longitude IS DISTINCT FROM OLD.longitude THEN
+    NEW.admin_area_id := poi_admin_area(NEW.geom);
+  END IF;
   RETURN NEW;
 END;
 $$;
@@ -70,7 +92,10 @@ EXECUTE FUNCTION pois_set_geom();
 
 CREATE INDEX idx_pois_categories ON pois USING GIN (categories);
 CREATE INDEX idx_pois_roles_gin ON pois USING GIN (poi_roles);
+CREATE INDEX idx_pois_themes_gin ON pois USING GIN (themes);
+CREATE INDEX idx_pois_search_doc ON pois USING GIN (search_doc);
 CREATE INDEX idx_pois_geom ON pois USING GIST (geom);
+CREATE INDEX idx_pois_admin_area ON pois (admin_area_id);
 CREATE INDEX idx_pois_rating ON pois (review_rating) WHERE review_rating IS NOT NULL;
 CREATE INDEX idx_pois_kids ON pois (kids_friendly) WHERE kids_friendly = true;
 CREATE INDEX idx_pois_pets ON pois (pets_friendly) WHERE pets_friendly = true;
@@ -97,43 +122,40 @@ CREATE POLICY "Allow public read access" ON category_role_map FOR SELECT USING (
 CREATE POLICY "Allow service role full access" ON category_role_map FOR ALL
   USING (auth.role() = 'service_role') WITH CHECK (auth.role() = 'service_role');
 
+-- Roles for a category list; accommodation beats meal
+CREATE OR REPLACE FUNCTION compute_poi_roles(p_categories text[])
+RETURNS poi_role[]
+LANGUAGE sql
+STABLE
+SET search_path = public
+AS $$
+  WITH r AS (
+    SELECT DISTINCT m.role
+    FROM unnest(p_categories) AS c
+    JOIN category_role_map m ON m.category = c
+  )
+  SELECT ARRAY(
+    SELECT role FROM r
+    WHERE NOT (role = 'meal'::poi_role
+               AND EXISTS (SELECT 1 FROM r WHERE role = 'accommodation'::poi_role))
+  );
+$$;
+
 CREATE OR REPLACE FUNCTION pois_set_roles()
 RETURNS trigger
 LANGUAGE plpgsql
 SET search_path = public
 AS $$
-DECLARE
-  computed_roles poi_role[];
-  has_accommodation boolean;
-  has_meal boolean;
 BEGIN
+  -- Bulk loads defer this to recompute_poi_derived()
+  IF current_setting('fika.defer_poi_triggers', true) = 'on' THEN
+    RETURN NEW;
+  END IF;
+
   IF NEW.categories IS NULL OR array_length(NEW.categories,1) IS NULL THEN
     NEW.poi_roles := ARRAY[]::poi_role[];
   ELSE
-    SELECT COALESCE(
-      ARRAY(
-        SELECT DISTINCT m.role
-        FROM unnest(NEW.categories) AS c
-        JOIN category_role_map m ON m.category = c
-      ),
-      ARRAY[]::poi_role[]
-    )
-    INTO computed_roles;
-    
-    -- Check if both accommodation and meal roles exist
-    has_accommodation := 'accommodation'::poi_role = ANY(computed_roles);
-    has_meal := 'meal'::poi_role = ANY(computed_roles);
-    
-    -- If both exist, remove meal role
-    IF has_accommodation AND has_meal THEN
-      computed_roles := ARRAY(
-        SELECT role 
-        FROM unnest(computed_roles) AS role 
-        WHERE role != 'meal'::poi_role
-      );
-    END IF;
-    
-    NEW.poi_roles := computed_roles;
+    NEW.poi_roles := compute_poi_roles(NEW.categories);
   END IF;
   RETURN NEW;
 END;
@@ -145,6 +167,68 @@ BEFORE INSERT OR UPDATE OF categories ON pois
 FOR EACH ROW
 EXECUTE FUNCTION pois_set_roles();
 
+-- Set-based equivalent of the pois geom/area/roles/themes/search_doc triggers, for bulk
+-- loads that ran with fika.defer_poi_triggers = 'on'. NULL ids = every POI.
+CREATE OR REPLACE FUNCTION recompute_poi_derived(p_ids uuid[] DEFAULT NULL)
+RETURNS bigint
+LANGUAGE plpgsql
+SET search_path = public
+AS $$
+DECLARE
+  v_count bigint;
+  v_prev text := current_setting('fika.defer_poi_triggers', true);
+BEGIN
+  PERFORM set_config('fika.defer_poi_triggers', 'on', true);
+
+  UPDATE pois p
+  SET geom = CASE
+               WHEN p.longitude IS NOT NULL AND p.latitude IS NOT NULL
+               THEN ST_SetSRID(ST_MakePoint(p.longitude, p.latitude), 4326)::geography
+             END,
+      admin_area_id = poi_admin_area(ST_SetSRID(ST_MakePoint(p.longitude, p.latitude), 4326)::geography),
+      poi_roles = CASE
+                    WHEN p.categories IS NULL OR array_length(p.categories, 1) IS NULL
+                    THEN ARRAY[]::poi_role[]
+                    ELSE compute_poi_roles(p.categories)
+                  END,
+      themes = compute_poi_themes(p.categories),
+      search_doc = compute_poi_search_doc(p.name, p.categories, p.address, p.descriptions)
+  WHERE p_ids IS NULL OR p.id = ANY (p_ids);
+  GET DIAGNOSTICS v_count = ROW_COUNT;
+
+  PERFORM set_config('fika.defer_poi_triggers', COALESCE(v_prev, 'off'), true);
+  RETURN v_count;
+END;
+$$;
+
+-- Refresh poi_roles for POIs tagged with any of p_categories, e.g. after
+-- category_role_map changed for them. Uses idx_pois_categories.
+CREATE OR REPLACE FUNCTION recompute_poi_roles(p_categories text[])
+RETURNS bigint
+LANGUAGE plpgsql
+SET search_path = public
+AS $$
+DECLARE
+  v_count bigint;
+BEGIN
+  IF p_categories IS NULL OR cardinality(p_categories) = 0 THEN
+    RETURN 0;
+  END IF;
+
+  UPDATE pois p
+  SET poi_roles = r.roles
+  FROM (
+    SELECT id, compute_poi_roles(categories) AS roles
+    FROM pois
+    WHERE categories && p_categories
+  ) r
+  WHERE p.id = r.id
+    AND p.poi_roles IS DISTINCT FROM r.roles;
+  GET DIAGNOSTICS v_count = ROW_COUNT;
+  RETURN v_count;
+END;
+$$;
+
 CREATE TABLE theme_category_map (
   theme theme_key NOT NULL,
   category text NOT NULL,
@@ -158,3 +242,252 @@ ALTER TABLE theme_category_map ENABLE ROW LEVEL SECURITY;
 CREATE POLICY "Allow public read access" ON theme_category_map FOR SELECT USING (true);
 CREATE POLICY "Allow service role full access" ON theme_category_map FOR ALL
   USING (auth.role() = 'service_role') WITH CHECK (auth.role() = 'service_role');
+
+-- ----------------------------------------------------------------------------
+-- Materialized pois.themes
+-- ----------------------------------------------------------------------------
+-- Kept in step with categories by trg_pois_set_themes, and with
+-- theme_category_map by statement triggers that refresh only the POIs whose
+-- categories were added to or removed from the map.
+-- ----------------------------------------------------------------------------
+CREATE OR REPLACE FUNCTION compute_poi_themes(p_categories text[])
+RETURNS theme_key[]
+LANGUAGE sql
+STABLE
+SET search_path = public
+AS $$
+  SELECT COALESCE(array_agg(DISTINCT t.theme ORDER BY t.theme), ARRAY[]::theme_key[])
+  FROM unnest(p_categories) AS c
+  JOIN theme_category_map t ON t.category = c;
+$$;
+
+CREATE OR REPLACE FUNCTION pois_set_themes()
+RETURNS trigger
+LANGUAGE plpgsql
+SET search_path = public
+AS $$
+BEGIN
+  -- Bulk loads defer this to recompute_poi_derived()
+  IF current_setting('fika.defer_poi_triggers', true) = 'on' THEN
+    RETURN NEW;
+  END IF;
+
+  NEW.themes := compute_poi_themes(NEW.categories);
+  RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_pois_set_themes ON pois;
+CREATE TRIGGER trg_pois_set_themes
+BEFORE INSERT OR UPDATE OF categories ON pois
+FOR EACH ROW
+EXECUTE FUNCTION pois_set_themes();
+
+-- Refresh themes for POIs tagged with any of p_categories. Uses idx_pois_categories.
+CREATE OR REPLACE FUNCTION recompute_poi_themes(p_categories text[])
+RETURNS bigint
+LANGUAGE plpgsql
+SET search_path = public
+AS $$
+DECLARE
+  v_count bigint;
+BEGIN
+  IF p_categories IS NULL OR cardinality(p_categories) = 0 THEN
+    RETURN 0;
+  END IF;
+
+  UPDATE pois p
+  SET themes = r.themes
+  FROM (
+    SELECT id, compute_poi_themes(categories) AS themes
+    FROM pois
+    WHERE categories && p_categories
+  ) r
+  WHERE p.id = r.id
+    AND p.themes IS DISTINCT FROM r.themes;
+  GET DIAGNOSTICS v_count = ROW_COUNT;
+  RETURN v_count;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION theme_category_map_refresh_pois()
+RETURNS trigger
+LANGUAGE plpgsql
+SET search_path = public
+AS $$
+DECLARE
+  v_categories text[];
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    SELECT array_agg(DISTINCT category) INTO v_categories FROM new_rows;
+  ELSIF TG_OP = 'DELETE' THEN
+    SELECT array_agg(DISTINCT category) INTO v_categories FROM old_rows;
+  ELSE
+    SELECT array_agg(DISTINCT category) INTO v_categories
+    FROM (SELECT category FROM new_rows UNION SELECT category FROM old_rows) c;
+  END IF;
+
+  PERFORM recompute_poi_themes(v_categories);
+  RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_tcm_refresh_pois_ins ON theme_category_map;
+CREATE TRIGGER trg_tcm_refresh_pois_ins
+AFTER INSERT ON theme_category_map
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION theme_category_map_refresh_pois();
+
+DROP TRIGGER IF EXISTS trg_tcm_refresh_pois_upd ON theme_category_map;
+CREATE TRIGGER trg_tcm_refresh_pois_upd
+AFTER UPDATE ON theme_category_map
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION theme_category_map_refresh_pois();
+
+DROP TRIGGER IF EXISTS trg_tcm_refresh_pois_del ON theme_category_map;
+CREATE TRIGGER trg_tcm_refresh_pois_del
+AFTER DELETE ON theme_category_map
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION theme_category_map_refresh_pois();
+
+-- ----------------------------------------------------------------------------
+-- Full-text search document
+-- ----------------------------------------------------------------------------
+-- pois.search_doc weights name (A) > categories (B) > address (C) >
+-- descriptions (D). Text is unaccented and parsed with the 'simple' config so
+-- place names are not stemmed. Queried by rpc_search_pois via
+-- poi_search_query() and idx_pois_search_doc.
+-- ----------------------------------------------------------------------------
+CREATE OR REPLACE FUNCTION compute_poi_search_doc(
+  p_name text,
+  p_categories text[],
+  p_address text,
+  p_descriptions text
+) RETURNS tsvector
+LANGUAGE sql
+STABLE
+SET search_path = public
+AS $$
+  SELECT setweight(to_tsvector('simple', unaccent(COALESCE(p_name, ''))), 'A')
+      || setweight(to_tsvector('simple', unaccent(COALESCE(array_to_string(p_categories, ' '), ''))), 'B')
+      || setweight(to_tsvector('simple', unaccent(COALESCE(p_address, ''))), 'C')
+      || setweight(to_tsvector('simple', unaccent(COALESCE(p_descriptions, ''))), 'D');
+$$;
+
+CREATE OR REPLACE FUNCTION pois_set_search_doc()
+RETURNS trigger
+LANGUAGE plpgsql
+SET search_path = public
+AS $$
+BEGIN
+  -- Bulk loads defer this to recompute_poi_derived()
+  IF current_setting('fika.defer_poi_triggers', true) = 'on' THEN
+    RETURN NEW;
+  END IF;
+
+  NEW.search_doc := compute_poi_search_doc(NEW.name, NEW.categories, NEW.address, NEW.descriptions);
+  RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_pois_set_search_doc ON pois;
+CREATE TRIGGER trg_pois_set_search_doc
+BEFORE INSERT OR UPDATE OF name, categories, address, descriptions ON pois
+FOR EACH ROW
+EXECUTE FUNCTION pois_set_search_doc();
+
+-- ----------------------------------------------------------------------------
+-- Mapping sync (load_roles.py / load_themes.py)
+-- ----------------------------------------------------------------------------
+-- Makes the table match p_rows (a JSON array of row objects) in one
+-- transaction: missing pairs are inserted and, when p_delete, pairs not in
+-- p_rows are removed. Returns how many rows were added and removed; the role
+-- sync also refreshes poi_roles for POIs in the affected categories.
+-- ----------------------------------------------------------------------------
+DROP FUNCTION IF EXISTS rpc_sync_category_role_map;
+CREATE OR REPLACE FUNCTION rpc_sync_category_role_map(
+  p_rows jsonb,
+  p_delete boolean DEFAULT true
+)
+RETURNS TABLE (added bigint, removed bigint, pois_updated bigint)
+LANGUAGE plpgsql
+SET search_path = public
+AS $$
+DECLARE
+  v_added text[];
+  v_removed text[];
+BEGIN
+  WITH desired AS (
+    SELECT DISTINCT r->>'category' AS category, (r->>'role')::poi_role AS role
+    FROM jsonb_array_elements(p_rows) AS r
+  ),
+  ins AS (
+    INSERT INTO category_role_map (category, role)
+    SELECT d.category, d.role FROM desired d
+    ON CONFLICT DO NOTHING
+    RETURNING category_role_map.category
+  )
+  SELECT COALESCE(array_agg(ins.category), ARRAY[]::text[]) INTO v_added FROM ins;
+
+  v_removed := ARRAY[]::text[];
+  IF p_delete THEN
+    WITH desired AS (
+      SELECT DISTINCT r->>'category' AS category, (r->>'role')::poi_role AS role
+      FROM jsonb_array_elements(p_rows) AS r
+    ),
+    del AS (
+      DELETE FROM category_role_map m
+      WHERE NOT EXISTS (
+        SELECT 1 FROM desired d WHERE d.category = m.category AND d.role = m.role
+      )
+      RETURNING m.category
+    )
+    SELECT COALESCE(array_agg(del.category), ARRAY[]::text[]) INTO v_removed FROM del;
+  END IF;
+
+  RETURN QUERY
+  SELECT cardinality(v_added)::bigint,
+         cardinality(v_removed)::bigint,
+         recompute_poi_roles(v_added || v_removed);
+END;
+$$;
+
+DROP FUNCTION IF EXISTS rpc_sync_theme_category_map;
+CREATE OR REPLACE FUNCTION rpc_sync_theme_category_map(
+  p_rows jsonb,
+  p_delete boolean DEFAULT true
+)
+RETURNS TABLE (added bigint, removed bigint)
+LANGUAGE sql
+SET search_path = public
+AS $$
+  WITH desired AS (
+    SELECT DISTINCT (r->>'theme')::theme_key AS theme, r->>'category' AS category
+    FROM jsonb_array_elements(p_rows) AS r
+  ),
+  ins AS (
+    INSERT INTO theme_category_map (theme, category)
+    SELECT theme, category FROM desired
+    ON CONFLICT DO NOTHING
+    RETURNING 1
+  ),
+  del AS (
+    DELETE FROM theme_category_map m
+    WHERE p_delete
+      AND NOT EXISTS (
+        SELECT 1 FROM desired d WHERE d.theme = m.theme AND d.category = m.category
+      )
+    RETURNING 1
+  )
+  SELECT (SELECT count(*) FROM ins), (SELECT count(*) FROM del);
+$$;
+
+-- Loader-only: keep these off the public API
+REVOKE EXECUTE ON FUNCTION rpc_sync_category_role_map FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION recompute_poi_derived FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION recompute_poi_roles FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION recompute_poi_themes FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION rpc_sync_theme_category_map FROM PUBLIC, anon, authenticated;
@@ -1,3 +1,6 @@
+DROP TABLE IF EXISTS admin_area_aliases;
+DROP TABLE IF EXISTS admin_area_tiles;
+DROP TABLE IF EXISTS admin_area_closure;
 DROP TABLE IF EXISTS admin_areas CASCADE;
 
 CREATE TABLE admin_areas (
@@ -8,9 +11,40 @@ CREATE TABLE admin_areas (
   admin_level int NOT NULL,
   parent_id uuid REFERENCES admin_areas(id),
   geom geometry(MULTIPOLYGON,4326) NOT NULL,
+  -- Cheaper tiers derived from geom (see admin_areas_set_derived)
+  bbox geometry(POLYGON,4326),
+  geom_simple geometry(MULTIPOLYGON,4326),
   UNIQUE (name, country_iso2, kind)
 );
 
+-- geom cut into pieces of at most 255 vertices; point-in-area tests against
+-- these touch one small tile instead of a whole coastline
+CREATE TABLE admin_area_tiles (
+  area_id uuid NOT NULL REFERENCES admin_areas(id) ON DELETE CASCADE,
+  geom geometry(POLYGON,4326) NOT NULL
+);
+
+-- Ancestry of every area, itself included (depth 0): descendants of X are
+-- SELECT descendant_id FROM admin_area_closure WHERE ancestor_id = X
+CREATE TABLE admin_area_closure (
+  ancestor_id uuid NOT NULL REFERENCES admin_areas(id) ON DELETE CASCADE,
+  descendant_id uuid NOT NULL REFERENCES admin_areas(id) ON DELETE CASCADE,
+  depth int NOT NULL,
+  PRIMARY KEY (ancestor_id, descendant_id)
+);
+
+-- Names destinations are looked up by, keyed by normalize_place_name().
+-- Every area's own name (and a country's ISO code) is kept here by
+-- trg_admin_areas_name_aliases; other aliases ("KL") are seeded by
+-- 22_admin_area_aliases.sql. See resolve_destination().
+CREATE TABLE admin_area_aliases (
+  alias_key text NOT NULL,
+  area_id uuid NOT NULL REFERENCES admin_areas(id) ON DELETE CASCADE,
+  alias text NOT NULL,
+  is_name boolean NOT NULL DEFAULT false,
+  PRIMARY KEY (alias_key, area_id)
+);
+
 DROP INDEX IF EXISTS admin_areas_geom_gist;
 DROP INDEX IF EXISTS admin_areas_parent_idx;
 DROP INDEX IF EXISTS admin_areas_country_idx;
@@ -20,8 +54,248 @@ CREATE INDEX IF NOT EXISTS admin_areas_geom_gist ON admin_areas USING GIST (geom
 CREATE INDEX IF NOT EXISTS admin_areas_parent_idx ON admin_areas(parent_id);
 CREATE INDEX IF NOT EXISTS admin_areas_country_idx ON admin_areas(country_iso2);
 CREATE INDEX IF NOT EXISTS admin_areas_kind_idx ON admin_areas(kind);
+CREATE INDEX IF NOT EXISTS admin_areas_bbox_gist ON admin_areas USING GIST (bbox);
+CREATE INDEX IF NOT EXISTS admin_area_tiles_geom_gist ON admin_area_tiles USING GIST (geom);
+CREATE INDEX IF NOT EXISTS admin_area_tiles_area_idx ON admin_area_tiles(area_id);
+CREATE INDEX IF NOT EXISTS admin_area_closure_descendant_idx ON admin_area_closure(descendant_id);
+CREATE INDEX IF NOT EXISTS admin_area_aliases_area_idx ON admin_area_aliases(area_id);
+CREATE INDEX IF NOT EXISTS admin_area_aliases_key_trgm ON admin_area_aliases USING GIN (alias_key gin_trgm_ops);
+
+CREATE OR REPLACE FUNCTION admin_areas_set_derived()
+RETURNS trigger
+LANGUAGE plpgsql
+SET search_path = public
+AS $$
+BEGIN
+  NEW.bbox := ST_Envelope(NEW.geom);
+  -- ~100 m tolerance: fine for display and coarse filtering, never for membership
+  NEW.geom_simple := ST_Multi(ST_SimplifyPreserveTopology(NEW.geom, 0.001));
+  RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_admin_areas_set_derived ON admin_areas;
+CREATE TRIGGER trg_admin_areas_set_derived
+BEFORE INSERT OR UPDATE OF geom ON admin_areas
+FOR EACH ROW
+EXECUTE FUNCTION admin_areas_set_derived();
+
+CREATE OR REPLACE FUNCTION admin_areas_set_tiles()
+RETURNS trigger
+LANGUAGE plpgsql
+SET search_path = public
+AS $$
+BEGIN
+  DELETE FROM admin_area_tiles WHERE area_id = NEW.id;
+  INSERT INTO admin_area_tiles (area_id, geom)
+  SELECT NEW.id, (ST_Dump(ST_Subdivide(NEW.geom, 255))).geom;
+  RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_admin_areas_set_tiles ON admin_areas;
+CREATE TRIGGER trg_admin_areas_set_tiles
+AFTER INSERT OR UPDATE OF geom ON admin_areas
+FOR EACH ROW
+EXECUTE FUNCTION admin_areas_set_tiles();
+
+-- The most specific admin area containing a point, or NULL. Tiles are exact
+-- pieces of each area's geom, so a tile hit is an exact containment test;
+-- LIMIT absorbs points that sit on a tile seam. Used by the pois triggers and
+-- 20_link_admin_areas.sql.
+CREATE OR REPLACE FUNCTION poi_admin_area(p_geom geography)
+RETURNS uuid
+LANGUAGE sql
+STABLE
+STRICT
+SET search_path = public
+AS $$
+  SELECT a.id
+  FROM admin_area_tiles t
+  JOIN admin_areas a ON a.id = t.area_id
+  WHERE ST_Intersects(p_geom::geometry, t.geom)
+    AND a.kind IN ('country', 'state')  -- Add 'district' for future use
+  ORDER BY CASE a.kind
+             WHEN 'district' THEN 3   -- Most specific (future use)
+             WHEN 'state' THEN 2       -- Specific
+             WHEN 'country' THEN 1     -- Fallback
+             ELSE 0
+           END DESC,
+           a.id
+  LIMIT 1;
+$$;
+
+-- admin_areas holds a few dozen rows, so the closure is simply rebuilt
+-- whenever the hierarchy changes
+CREATE OR REPLACE FUNCTION rebuild_admin_area_closure()
+RETURNS trigger
+LANGUAGE plpgsql
+SET search_path = public
+AS $$
+BEGIN
+  DELETE FROM admin_area_closure;
+  INSERT INTO admin_area_closure (ancestor_id, descendant_id, depth)
+  WITH RECURSIVE tree AS (
+    SELECT id AS ancestor_id, id AS descendant_id, 0 AS depth
+    FROM admin_areas
+    UNION ALL
+    SELECT t.ancestor_id, a.id, t.depth + 1
+    FROM tree t
+    JOIN admin_areas a ON a.parent_id = t.descendant_id
+    WHERE t.depth < 16  -- guards against a parent_id cycle
+  )
+  SELECT ancestor_id, descendant_id, min(depth)
+  FROM tree
+  GROUP BY ancestor_id, descendant_id;
+  RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_admin_areas_closure ON admin_areas;
+CREATE TRIGGER trg_admin_areas_closure
+AFTER INSERT OR UPDATE OF parent_id OR DELETE ON admin_areas
+FOR EACH STATEMENT
+EXECUTE FUNCTION rebuild_admin_area_closure();
+
+-- ----------------------------------------------------------------------------
+-- Destination resolution
+-- ----------------------------------------------------------------------------
+-- One place-name lookup shared by rpc_fetch_poi_candidates_quota and
+-- rpc_search_pois: an exact probe of admin_area_aliases, then a trigram
+-- fallback for misspellings. rpc_search_locations uses the exact probe only.
+-- ----------------------------------------------------------------------------
+
+-- Lookup key for a place name: unaccented, lowercase, punctuation and
+-- repeated spaces collapsed ('Pulau  Pinang.' -> 'pulau pinang')
+CREATE OR REPLACE FUNCTION normalize_place_name(p_name text)
+RETURNS text
+LANGUAGE sql
+STABLE
+SET search_path = public
+AS $$
+  SELECT NULLIF(btrim(regexp_replace(lower(unaccent(COALESCE(p_name, ''))), '[^[:alnum:]]+', ' ', 'g')), '');
+$$;
+
+CREATE OR REPLACE FUNCTION admin_areas_sync_name_aliases()
+RETURNS trigger
+LANGUAGE plpgsql
+SET search_path = public
+AS $$
+BEGIN
+  IF TG_OP = 'UPDATE' THEN
+    DELETE FROM admin_area_aliases WHERE area_id = NEW.id AND is_name;
+  END IF;
+
+  INSERT INTO admin_area_aliases (alias_key, area_id, alias, is_name)
+  SELECT DISTINCT ON (normalize_place_name(v)) normalize_place_name(v), NEW.id, v, true
+  FROM (VALUES (NEW.name), (CASE WHEN NEW.kind = 'country' THEN NEW.country_iso2::text END)) AS t(v)
+  WHERE normalize_place_name(v) IS NOT NULL
+  ON CONFLICT (alias_key, area_id) DO UPDATE
+  SET alias = EXCLUDED.alias, is_name = true;
+  RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_admin_areas_name_aliases ON admin_areas;
+CREATE TRIGGER trg_admin_areas_name_aliases
+AFTER INSERT OR UPDATE OF name, kind, country_iso2 ON admin_areas
+FOR EACH ROW
+EXECUTE FUNCTION admin_areas_sync_name_aliases();
+
+-- The area an exact normalized alias key names, or NULL: a primary key probe
+-- preferring real names, then the broadest area. Optionally limited to one
+-- country.
+CREATE OR REPLACE FUNCTION lookup_destination_alias(p_key text, p_iso2 char(2) DEFAULT NULL)
+RETURNS uuid
+LANGUAGE sql
+STABLE
+SET search_path = public
+AS $$
+  SELECT al.area_id
+  FROM admin_area_aliases al
+  JOIN admin_areas a ON a.id = al.area_id
+  WHERE al.alias_key = p_key
+    AND (p_iso2 IS NULL OR a.country_iso2 = p_iso2)
+  ORDER BY al.is_name DESC, a.admin_level, a.name
+  LIMIT 1;
+$$;
+
+-- The admin area a destination string names, or NULL. Accepts "Place" or
+-- "Place, Country" (country by name, alias or ISO code); with a country the
+-- place must lie in it, and an unknown place falls back to the country.
+-- Exact alias matches go through lookup_destination_alias(); misspellings
+-- fall back to the most similar alias.
+CREATE OR REPLACE FUNCTION resolve_destination(p_destination text)
+RETURNS uuid
+LANGUAGE plpgsql
+STABLE
+SET search_path = public
+AS $$
+DECLARE
+  v_key text := normalize_place_name(split_part(p_destination, ',', 1));
+  v_country_key text := normalize_place_name(split_part(p_destination, ',', 2));
+  v_iso2 char(2);
+  v_id uuid;
+BEGIN
+  IF v_key IS NULL THEN
+    RETURN NULL;
+  END IF;
+
+  IF v_country_key IS NOT NULL THEN
+    SELECT a.country_iso2 INTO v_iso2
+    FROM admin_area_aliases al
+    JOIN admin_areas a ON a.id = al.area_id
+    WHERE al.alias_key = v_country_key AND a.kind = 'country'
+    LIMIT 1;
+  END IF;
+
+  v_id := lookup_destination_alias(v_key, v_iso2);
+  IF v_id IS NOT NULL THEN
+    RETURN v_id;
+  END IF;
+
+  -- Fuzzy: closest alias by trigram similarity (admin_area_aliases_key_trgm)
+  SELECT al.area_id INTO v_id
+  FROM admin_area_aliases al
+  JOIN admin_areas a ON a.id = al.area_id
+  WHERE al.alias_key % v_key
+    AND similarity(al.alias_key, v_key) >= 0.5
+    AND (v_iso2 IS NULL OR a.country_iso2 = v_iso2)
+  ORDER BY similarity(al.alias_key, v_key) DESC, al.is_name DESC, a.admin_level
+  LIMIT 1;
+
+  IF v_id IS NULL AND v_iso2 IS NOT NULL THEN
+    SELECT a.id INTO v_id
+    FROM admin_areas a
+    WHERE a.kind = 'country' AND a.country_iso2 = v_iso2
+    LIMIT 1;
+  END IF;
+  RETURN v_id;
+END;
+$$;
 
 DROP FUNCTION IF EXISTS rpc_upsert_admin_area_geojson;
+DROP FUNCTION IF EXISTS rpc_upsert_admin_areas_geojson;
+
+CREATE OR REPLACE FUNCTION admin_area_geom_from_geojson(p_geom_geojson jsonb)
+RETURNS geometry
+LANGUAGE plpgsql
+IMMUTABLE
+SET search_path = public
+AS $$
+DECLARE
+  v_geom geometry;
+BEGIN
+  v_geom := ST_SetSRID(ST_GeomFromGeoJSON(p_geom_geojson::text), 4326);
+  v_geom := ST_Force2D(v_geom);
+  IF GeometryType(v_geom) = 'POLYGON' THEN
+    v_geom := ST_Multi(v_geom);
+  ELSIF GeometryType(v_geom) NOT IN ('MULTIPOLYGON', 'GEOMETRYCOLLECTION') THEN
+    RAISE EXCEPTION 'Geometry must be Polygon or MultiPolygon, got %', GeometryType(v_geom);
+  END IF;
+  RETURN v_geom;
+END;
+$$;
 
 CREATE OR REPLACE FUNCTION rpc_upsert_admin_area_geojson(
   p_name text,
@@ -40,13 +314,7 @@ DECLARE
   v_geom geometry;
   v_id uuid;
 BEGIN
-  v_geom := ST_SetSRID(ST_GeomFromGeoJSON(p_geom_geojson::text), 4326);
-  v_geom := ST_Force2D(v_geom);
-  IF GeometryType(v_geom) = 'POLYGON' THEN
-    v_geom := ST_Multi(v_geom);
-  ELSIF GeometryType(v_geom) NOT IN ('MULTIPOLYGON', 'GEOMETRYCOLLECTION') THEN
-    RAISE EXCEPTION 'Geometry must be Polygon or MultiPolygon, got %', GeometryType(v_geom);
-  END IF;
+  v_geom := admin_area_geom_from_geojson(p_geom_geojson);
 
   INSERT INTO admin_areas (name, country_iso2, kind, admin_level, parent_id, geom)
   VALUES (p_name, p_country_iso2, p_kind, p_admin_level, p_parent_id, v_geom)
@@ -60,5 +328,81 @@ BEGIN
 END;
 $$;
 
+-- ----------------------------------------------------------------------------
+-- Function: rpc_upsert_admin_areas_geojson
+-- ----------------------------------------------------------------------------
+-- Upserts a set of areas in one transaction. Each element of p_areas:
+--   {"name", "country_iso2", "kind", "admin_level", "geom": <GeoJSON>,
+--    "parent": {"name", "country_iso2", "kind"} | null}
+-- Parents are resolved by key after the insert, so they may be part of the
+-- same batch or already in the table. Unresolved parents leave parent_id NULL.
+--
+-- Returns one row per input area with its id and resolved parent_id.
+-- ----------------------------------------------------------------------------
+CREATE OR REPLACE FUNCTION rpc_upsert_admin_areas_geojson(p_areas jsonb)
+RETURNS TABLE (
+  id uuid,
+  name text,
+  country_iso2 char(2),
+  kind text,
+  parent_id uuid
+)
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+#variable_conflict use_column
+BEGIN
+  INSERT INTO admin_areas (name, country_iso2, kind, admin_level, geom)
+  SELECT a->>'name',
+         (a->>'country_iso2')::char(2),
+         a->>'kind',
+         (a->>'admin_level')::int,
+         admin_area_geom_from_geojson(a->'geom')
+  FROM jsonb_array_elements(p_areas) AS a
+  ON CONFLICT ON CONSTRAINT admin_areas_name_country_iso2_kind_key DO UPDATE
+  SET admin_level = EXCLUDED.admin_level,
+      geom = EXCLUDED.geom;
+
+  UPDATE admin_areas child
+  SET parent_id = r.parent_id
+  FROM (
+    SELECT a->>'name' AS name,
+           (a->>'country_iso2')::char(2) AS country_iso2,
+           a->>'kind' AS kind,
+           par.id AS parent_id
+    FROM jsonb_array_elements(p_areas) AS a
+    LEFT JOIN admin_areas par
+      ON par.name = a->'parent'->>'name'
+     AND par.country_iso2 = (a->'parent'->>'country_iso2')::char(2)
+     AND par.kind = a->'parent'->>'kind'
+  ) r
+  WHERE child.name = r.name
+    AND child.country_iso2 = r.country_iso2
+    AND child.kind = r.kind
+    AND child.parent_id IS DISTINCT FROM r.parent_id;
+
+  RETURN QUERY
+  SELECT aa.id, aa.name, aa.country_iso2, aa.kind, aa.parent_id
+  FROM jsonb_array_elements(p_areas) AS a
+  JOIN admin_areas aa
+    ON aa.name = a->>'name'
+   AND aa.country_iso2 = (a->>'country_iso2')::char(2)
+   AND aa.kind = a->>'kind';
+END;
+$$;
+
+-- Loader-only (load_polygon.py, service role)
+REVOKE EXECUTE ON FUNCTION rpc_upsert_admin_areas_geojson FROM PUBLIC, anon, authenticated;
+
 ALTER TABLE admin_areas ENABLE ROW LEVEL SECURITY;
 CREATE POLICY "Allow public read access" ON admin_areas FOR SELECT USING (true);
+
+ALTER TABLE admin_area_tiles ENABLE ROW LEVEL SECURITY;
+CREATE POLICY "Allow public read access" ON admin_area_tiles FOR SELECT USING (true);
+
+ALTER TABLE admin_area_closure ENABLE ROW LEVEL SECURITY;
+CREATE POLICY "Allow public read access" ON admin_area_closure FOR SELECT USING (true);
+
+ALTER TABLE admin_area_aliases ENABLE ROW LEVEL SECURITY;
+CREATE POLICY "Allow public read access" ON admin_area_aliases FOR SELECT USING (true);
@@ -1,3 +1,4 @@
+-- migrate: destructive (drops user data; see src/run_sql.py)
 -- Itineraries table for storing trip plans
 DROP TABLE IF EXISTS itineraries CASCADE;
 
@@ -30,7 +31,9 @@ CREATE TABLE itineraries (
 -- Indexes
 CREATE INDEX idx_itineraries_user_id ON itineraries(user_id) WHERE user_id IS NOT NULL;
 CREATE INDEX idx_itineraries_created_at ON itineraries(created_at DESC);
-CREATE INDEX idx_itineraries_updated_at ON itineraries(updated_at DESC);
+-- Keyset order of rpc_list_itineraries / rpc_list_user_itineraries
+CREATE INDEX idx_itineraries_updated_at ON itineraries(updated_at DESC, id DESC);
+CREATE INDEX idx_itineraries_user_updated_at ON itineraries(user_id, updated_at DESC, id DESC) WHERE user_id IS NOT NULL;
 CREATE INDEX idx_itineraries_status ON itineraries(status);
 CREATE INDEX idx_itineraries_destinations ON itineraries USING GIN (destinations);
 
@@ -204,13 +207,43 @@ BEGIN
 END;
 $$;
 
+-- Planner estimate of the rows the itinerary lists would count, for p_count => 'estimated'
+CREATE OR REPLACE FUNCTION estimate_itineraries_count(p_user_id uuid, p_status text)
+RETURNS bigint
+LANGUAGE plpgsql
+VOLATILE
+SET search_path = public
+AS $$
+DECLARE
+  v_plan jsonb;
+BEGIN
+  EXECUTE format(
+    'EXPLAIN (FORMAT JSON) SELECT 1 FROM itineraries i
+     WHERE (%1$L::uuid IS NULL OR i.user_id = %1$L::uuid)
+       AND (%2$L::text IS NULL OR i.status = %2$L::text)',
+    p_user_id, p_status
+  ) INTO v_plan;
+  RETURN (v_plan -> 0 -> 'Plan' ->> 'Plan Rows')::bigint;
+END;
+$$;
+
+-- Internal: runs dynamic EXPLAIN; callers are SECURITY DEFINER
+REVOKE EXECUTE ON FUNCTION estimate_itineraries_count FROM PUBLIC, anon, authenticated;
+
 -- List itineraries (with pagination)
+-- Pass the last row's updated_at and id as p_after_* for the next page.
+-- p_count: 'exact' (COUNT(*)), 'estimated' (planner estimate) or 'none'.
+-- SECURITY DEFINER only so it can call estimate_itineraries_count; rows are
+-- still limited to what the public read policy already exposes.
 DROP FUNCTION IF EXISTS rpc_list_itineraries;
 CREATE OR REPLACE FUNCTION rpc_list_itineraries(
   p_user_id uuid DEFAULT NULL,
   p_status text DEFAULT 'active',
   p_limit integer DEFAULT 20,
-  p_offset integer DEFAULT 0
+  p_offset integer DEFAULT 0,
+  p_after_updated_at timestamptz DEFAULT NULL,
+  p_after_id uuid DEFAULT NULL,
+  p_count text DEFAULT 'exact'
 )
 RETURNS TABLE (
   id uuid,
@@ -224,16 +257,29 @@ RETURNS TABLE (
 )
 LANGUAGE plpgsql
 STABLE
+SECURITY DEFINER
 SET search_path = public
 AS $$
 DECLARE
   v_total_count bigint;
 BEGIN
+  -- A cursor needs both halves; with one missing the keyset comparison is
+  -- NULL and the page would come back empty
+  IF (p_after_id IS NULL) <> (p_after_updated_at IS NULL) THEN
+    RAISE EXCEPTION 'p_after_updated_at and p_after_id must be given together (the last row''s updated_at and id)';
+  END IF;
+
   -- Get total count
-  SELECT COUNT(*) INTO v_total_count
-  FROM itineraries i
-  WHERE (p_user_id IS NULL OR i.user_id = p_user_id)
-    AND (p_status IS NULL OR i.status = p_status);
+  IF p_count = 'exact' THEN
+    SELECT COUNT(*) INTO v_total_count
+    FROM itineraries i
+    WHERE (p_user_id IS NULL OR i.user_id = p_user_id)
+      AND (p_status IS NULL OR i.status = p_status);
+  ELSIF p_count = 'estimated' THEN
+    v_total_count := estimate_itineraries_count(p_user_id, p_status);
+  ELSIF p_count <> 'none' THEN
+    RAISE EXCEPTION 'p_count must be exact, estimated or none, got %', p_count;
+  END IF;
   
   RETURN QUERY
   SELECT 
@@ -248,7 +294,8 @@ BEGIN
   FROM itineraries i
   WHERE (p_user_id IS NULL OR i.user_id = p_user_id)
     AND (p_status IS NULL OR i.status = p_status)
-  ORDER BY i.updated_at DESC
+    AND (p_after_id IS NULL OR (i.updated_at, i.id) < (p_after_updated_at, p_after_id))
+  ORDER BY i.updated_at DESC, i.id DESC
   LIMIT p_limit OFFSET p_offset;
 END;
 $$;
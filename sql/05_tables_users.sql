@@ -1,3 +1,4 @@
+-- migrate: destructive (drops user data; see src/run_sql.py)
 -- Drop existing users table if exists
 DROP TABLE IF EXISTS users CASCADE;
 
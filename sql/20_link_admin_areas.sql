@@ -1,41 +1,24 @@
+-- migrate: always (data step; depends on what phase-two loaded)
+-- Fallback for states loaded without a parent key; load_polygon.py resolves
+-- parents in rpc_upsert_admin_areas_geojson, so this normally updates nothing.
 UPDATE admin_areas child
 SET parent_id = parent.id
 FROM admin_areas parent
 WHERE child.kind = 'state'
   AND parent.kind = 'country'
   AND parent.country_iso2 = child.country_iso2
-  AND ST_Intersects(child.geom, parent.geom)
+  AND child.bbox && parent.bbox
+  AND ST_Intersects(child.geom_simple, parent.geom_simple)
+  -- geom_simple is only a prefilter: the exact test puts a point of the
+  -- child inside the parent's full outline, so bordering areas don't match
+  AND ST_Intersects(ST_PointOnSurface(child.geom), parent.geom)
   AND child.parent_id IS NULL;
 
 
-ALTER TABLE pois ADD COLUMN IF NOT EXISTS admin_area_id uuid;
-CREATE INDEX IF NOT EXISTS idx_pois_admin_area ON pois(admin_area_id);
-
--- Assign POIs to the most specific admin area they intersect with
-WITH hits AS (
-  SELECT p.id AS poi_id, a.id AS area_id,
-         CASE a.kind 
-           WHEN 'district' THEN 3   -- Most specific (future use)
-           WHEN 'state' THEN 2       -- Specific
-           WHEN 'country' THEN 1     -- Fallback
-           ELSE 0 
-         END AS rank
-  FROM pois p
-  JOIN admin_areas a
-    ON p.geom IS NOT NULL
-   AND ST_Intersects(p.geom::geometry, a.geom)
-   AND a.kind IN ('country', 'state')  -- Add 'district' for future use
-),
-pick AS (
-  SELECT poi_id, area_id
-  FROM (
-    SELECT poi_id, area_id,
-           ROW_NUMBER() OVER (PARTITION BY poi_id ORDER BY rank DESC) rn
-    FROM hits
-  ) z
-  WHERE rn = 1
-)
+-- Reassign every POI after areas were (re)loaded; POIs written later are
+-- assigned by the pois triggers. Rows already in the right area are skipped.
 UPDATE pois p
 SET admin_area_id = pick.area_id
-FROM pick
-WHERE p.id = pick.poi_id;
+FROM (SELECT id, poi_admin_area(geom) AS area_id FROM pois) pick
+WHERE p.id = pick.id
+  AND p.admin_area_id IS DISTINCT FROM pick.area_id;
@@ -0,0 +1,63 @@
+-- ----------------------------------------------------------------------------
+-- POI quality score
+-- ----------------------------------------------------------------------------
+-- quality_score is a stored generated column so candidate ranking reads it
+-- (and the per-role area indexes below) instead of computing it per request.
+-- The weights live only in poi_quality_score(): edit them here and rerun
+-- phase-three; the runner reapplies this file and recompute_poi_quality()
+-- rewrites the rows whose score changed.
+-- ----------------------------------------------------------------------------
+CREATE OR REPLACE FUNCTION poi_quality_score(p_rating numeric, p_reviews int)
+RETURNS double precision
+LANGUAGE sql
+IMMUTABLE
+PARALLEL SAFE
+SET search_path = public
+AS $$
+  -- rating (0-5) contributes 20%, review_count (log-scaled, saturating at
+  -- 100k reviews) contributes 80%
+  SELECT (COALESCE(p_rating / 5.0, 0) * 0.2)::double precision
+       + LEAST(LN(GREATEST(p_reviews, 1)) / LN(100000), 1.0) * 0.8;
+$$;
+
+ALTER TABLE pois ADD COLUMN IF NOT EXISTS quality_score double precision
+  GENERATED ALWAYS AS (poi_quality_score(review_rating, review_count)) STORED;
+
+-- Generated columns are only recomputed when their row is written, so touch
+-- the rows whose stored score no longer matches the current weights.
+CREATE OR REPLACE FUNCTION recompute_poi_quality()
+RETURNS bigint
+LANGUAGE plpgsql
+SET search_path = public
+AS $$
+DECLARE
+  v_count bigint;
+  v_prev text := current_setting('fika.defer_poi_triggers', true);
+BEGIN
+  -- Only review_count is touched; skip the geom/roles/themes triggers
+  PERFORM set_config('fika.defer_poi_triggers', 'on', true);
+
+  UPDATE pois
+  SET review_count = review_count
+  WHERE quality_score IS DISTINCT FROM poi_quality_score(review_rating, review_count);
+  GET DIAGNOSTICS v_count = ROW_COUNT;
+
+  PERFORM set_config('fika.defer_poi_triggers', COALESCE(v_prev, 'off'), true);
+  RETURN v_count;
+END;
+$$;
+
+REVOKE EXECUTE ON FUNCTION recompute_poi_quality FROM PUBLIC, anon, authenticated;
+
+SELECT recompute_poi_quality();
+
+-- Per-area top-N by role, served from an index scan
+CREATE INDEX IF NOT EXISTS idx_pois_area_quality_attraction
+  ON pois (admin_area_id, quality_score DESC)
+  WHERE 'attraction' = ANY (poi_roles);
+CREATE INDEX IF NOT EXISTS idx_pois_area_quality_meal
+  ON pois (admin_area_id, quality_score DESC)
+  WHERE 'meal' = ANY (poi_roles);
+CREATE INDEX IF NOT EXISTS idx_pois_area_quality_accommodation
+  ON pois (admin_area_id, quality_score DESC)
+  WHERE 'accommodation' = ANY (poi_roles);
@@ -0,0 +1,31 @@
+-- migrate: always (data step; depends on what phase-two loaded)
+-- ----------------------------------------------------------------------------
+-- Destination aliases
+-- ----------------------------------------------------------------------------
+-- Extra names resolve_destination() accepts for an area. Areas' own names and
+-- country ISO codes are added by trg_admin_areas_name_aliases; list only
+-- abbreviations, local spellings and common informal names here. Rows naming
+-- an area that is not loaded are skipped.
+-- ----------------------------------------------------------------------------
+INSERT INTO admin_area_aliases (alias_key, area_id, alias)
+SELECT normalize_place_name(v.alias), a.id, v.alias
+FROM (VALUES
+  ('Singapura',                           'Singapore',       'SG', 'country'),
+  ('KL',                                  'Kuala Lumpur',    'MY', 'state'),
+  ('Wilayah Persekutuan Kuala Lumpur',    'Kuala Lumpur',    'MY', 'state'),
+  ('Federal Territory of Kuala Lumpur',   'Kuala Lumpur',    'MY', 'state'),
+  ('Wilayah Persekutuan Putrajaya',       'Putrajaya',       'MY', 'state'),
+  ('Wilayah Persekutuan Labuan',          'Labuan',          'MY', 'state'),
+  ('Penang Island',                       'Penang',          'MY', 'state'),
+  ('Pulau Pinang',                        'Penang',          'MY', 'state'),
+  ('Melaka',                              'Malacca',         'MY', 'state'),
+  ('Johore',                              'Johor',           'MY', 'state'),
+  ('Negri Sembilan',                      'Negeri Sembilan', 'MY', 'state'),
+  ('NS',                                  'Negeri Sembilan', 'MY', 'state'),
+  ('Trengganu',                           'Terengganu',      'MY', 'state')
+) AS v(alias, name, country_iso2, kind)
+JOIN admin_areas a
+  ON a.name = v.name
+ AND a.country_iso2 = v.country_iso2
+ AND a.kind = v.kind
+ON CONFLICT (alias_key, area_id) DO NOTHING;
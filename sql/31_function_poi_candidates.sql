@@ -1,5 +1,29 @@
 DROP FUNCTION IF EXISTS rpc_fetch_poi_candidates_quota;
 
+-- Proximity mode arguments: a zero radius would divide by zero, a negative
+-- one matches nothing, and a weight outside [0, 1] inverts the ranking.
+CREATE OR REPLACE FUNCTION check_proximity_args(
+  p_radius_m double precision,
+  p_proximity_weight double precision
+) RETURNS boolean
+LANGUAGE plpgsql
+IMMUTABLE
+SET search_path = public
+AS $$
+BEGIN
+  IF p_radius_m IS NULL THEN
+    RETURN true;
+  END IF;
+  IF p_radius_m <= 0 THEN
+    RAISE EXCEPTION 'p_radius_m must be greater than 0, got %', p_radius_m;
+  END IF;
+  IF p_proximity_weight IS NULL OR p_proximity_weight NOT BETWEEN 0 AND 1 THEN
+    RAISE EXCEPTION 'p_proximity_weight must be between 0 and 1, got %', p_proximity_weight;
+  END IF;
+  RETURN true;
+END;
+$$;
+
 CREATE OR REPLACE FUNCTION rpc_fetch_poi_candidates_quota(
   p_destination text,
   p_themes text[],
@@ -20,7 +44,11 @@ CREATE OR REPLACE FUNCTION rpc_fetch_poi_candidates_quota(
   p_include_images boolean DEFAULT true,
   p_excluded_themes text[] DEFAULT NULL,
   p_seed_lon numeric DEFAULT NULL,
-  p_seed_lat numeric DEFAULT NULL
+  p_seed_lat numeric DEFAULT NULL,
+  -- Proximity mode (needs the seed): only POIs within p_radius_m of the seed,
+  -- read nearest-first, ranked by quality blended with distance decay
+  p_radius_m double precision DEFAULT NULL,
+  p_proximity_weight double precision DEFAULT 0.5
 )
 RETURNS TABLE (
   id uuid,
@@ -55,61 +83,60 @@ SET search_path = public
 AS
 $$
 WITH dest AS (
-  SELECT id, kind, geom
-  FROM admin_areas
-  WHERE name ILIKE SPLIT_PART(p_destination, ',', 1)
-  ORDER BY CASE kind WHEN 'country' THEN 2 WHEN 'city' THEN 1 ELSE 0 END DESC
-  LIMIT 1
+  SELECT resolve_destination(p_destination) AS id
+  WHERE check_proximity_args(p_radius_m, p_proximity_weight)
 ),
+-- The destination and every area below it
 cover AS (
-  SELECT id, geom FROM dest
-  UNION
-  SELECT aa.id, aa.geom
-  FROM admin_areas aa
-  JOIN dest d ON aa.parent_id = d.id
+  SELECT c.descendant_id AS id
+  FROM dest d
+  JOIN admin_area_closure c ON c.ancestor_id = d.id
 ),
 seed AS (
   SELECT CASE
            WHEN p_seed_lon IS NOT NULL AND p_seed_lat IS NOT NULL
-           THEN ST_SetSRID(ST_MakePoint(p_seed_lon, p_seed_lat), 4326)
-           ELSE NULL::geometry
+           THEN ST_SetSRID(ST_MakePoint(p_seed_lon, p_seed_lat), 4326)::geography
+           ELSE NULL::geography
          END AS g
 ),
-base AS (
-  SELECT DISTINCT p.*, a.id AS area_id, a.geom AS area_geom,
-  CASE
-    WHEN 'attraction' = ANY(p.poi_roles)
-      THEN (
-        SELECT COALESCE(array_agg(DISTINCT t.theme)::theme_key[], ARRAY[]::theme_key[])
-        FROM unnest(p.categories) AS c
-        JOIN theme_category_map t ON t.category = c
-      )
-    ELSE ARRAY[]::theme_key[]
-  END AS themes
+-- Every POI that passes the request filters. NOT MATERIALIZED: each
+-- reference below is planned separately, with its own area/role predicates
+-- and LIMIT, so only the rows that can make the cut are read.
+eligible AS NOT MATERIALIZED (
+  -- Area membership is admin_area_id, the most specific area containing the
+  -- POI (20_link_admin_areas.sql), so no spatial test is needed
+  SELECT
+    p.*,
+    -- Theme match score: prioritize attractions matching user themes
+    CASE
+      WHEN 'attraction' = ANY(p.poi_roles)
+           AND p_themes IS NOT NULL
+           AND array_length(p_themes, 1) > 0
+           AND p.themes && p_themes::theme_key[]
+      THEN 1
+      ELSE 0
+    END AS theme_match,
+    CASE WHEN (SELECT g FROM seed) IS NOT NULL
+         THEN ST_Distance(p.geom, (SELECT g FROM seed))
+         ELSE NULL::double precision
+    END AS distance_m,
+    -- Ranking score: quality alone, or in proximity mode blended with a
+    -- distance decay that falls to ~5% at p_radius_m
+    CASE WHEN p_radius_m IS NOT NULL AND (SELECT g FROM seed) IS NOT NULL
+         THEN (1 - p_proximity_weight) * p.quality_score
+              + p_proximity_weight * exp(-3.0 * ST_Distance(p.geom, (SELECT g FROM seed)) / p_radius_m)
+         ELSE p.quality_score
+    END AS rank_score
   FROM pois p
-  JOIN LATERAL (
-     SELECT id, geom
-     FROM cover
-     WHERE p.geom IS NOT NULL
-       AND ST_Intersects(p.geom::geometry, geom)
-     ORDER BY ST_Area(geom) ASC NULLS LAST
-     LIMIT 1
-  ) a ON TRUE
   WHERE
-    p.poi_roles::text[] && p_roles::text[]
-    AND p.review_rating >= p_min_rating
+    p.review_rating >= p_min_rating
     AND p.review_count >= p_min_reviews
     AND (
         'accommodation' = ANY(p.poi_roles)
         OR 'meal' = ANY(p.poi_roles)  -- Meals don't need to match themes
         OR p_themes IS NULL
         OR array_length(p_themes, 1) IS NULL  -- Empty themes = return all attractions
-        OR EXISTS (
-            SELECT 1
-            FROM unnest(p.categories) AS c
-            JOIN theme_category_map t ON t.category = c
-            WHERE t.theme = ANY (p_themes::theme_key[])
-        )
+        OR p.themes && p_themes::theme_key[]
     )
     AND (
       NOT ('meal' = ANY(p.poi_roles)) OR (
@@ -128,12 +155,7 @@ base AS (
       p_excluded_themes IS NULL
       OR array_length(p_excluded_themes,1) IS NULL
       OR NOT ('attraction' = ANY(p.poi_roles))
-      OR NOT EXISTS (
-          SELECT 1
-          FROM unnest(p.categories) AS c
-          JOIN theme_category_map t ON t.category = c
-          WHERE t.theme::text = ANY (p_excluded_themes)
-      )
+      OR NOT (p.themes::text[] && p_excluded_themes)
     )
     AND (
       NOT p_kids_friendly_only OR CASE WHEN ('attraction' = ANY(p.poi_roles) OR 'meal' = ANY(p.poi_roles)) THEN COALESCE(p.kids_friendly, false) ELSE true END
@@ -142,57 +164,136 @@ base AS (
       NOT p_pets_friendly_only OR CASE WHEN ('attraction' = ANY(p.poi_roles) OR 'meal' = ANY(p.poi_roles)) THEN COALESCE(p.pets_friendly, false) ELSE true END
     )
 ),
-scored AS (
-  SELECT
-    b.*,
-    aa.name AS area_name,
-    CASE WHEN (SELECT g FROM seed) IS NOT NULL
-         THEN ST_Distance(b.geom::geography, (SELECT g FROM seed)::geography)
-         ELSE NULL::double precision
-    END AS distance_m,
-    -- Theme match score: prioritize attractions matching user themes
-    CASE
-      WHEN 'attraction' = ANY(b.poi_roles)
-           AND p_themes IS NOT NULL
-           AND array_length(p_themes, 1) > 0
-           AND b.themes && p_themes::theme_key[]
-      THEN 1
-      ELSE 0
-    END AS theme_match,
-    -- Quality score combining rating and reviews (similar to MAUT popularity_score)
-    -- rating (0-5) contributes 20%, review_count (log-scaled) contributes 80%
-    COALESCE(b.review_rating / 5.0, 0) * 0.2 +
-    LEAST(LN(GREATEST(b.review_count, 1)) / LN(100000), 1.0) * 0.8 AS quality_score
-  FROM base b
-  LEFT JOIN admin_areas aa ON aa.id = b.area_id
+-- Area mode: each area's top p_per_area_cap per role. Role predicates are
+-- literals so every branch walks idx_pois_area_quality_<role> in
+-- quality_score order and stops at the cap; theme matches rank first, so they
+-- are read as their own ordered slice. Roles not requested or with a zero
+-- quota are never scanned.
+area_top AS (
+  SELECT 'attraction'::text AS role_pick, t.*
+  FROM cover c
+  CROSS JOIN LATERAL (
+    SELECT u.* FROM (
+      (SELECT e.* FROM eligible e
+       WHERE e.admin_area_id = c.id AND 'attraction' = ANY(e.poi_roles) AND e.theme_match = 1
+       ORDER BY e.quality_score DESC, COALESCE(e.distance_m, 1e9)
+       LIMIT p_per_area_cap)
+      UNION ALL
+      (SELECT e.* FROM eligible e
+       WHERE e.admin_area_id = c.id AND 'attraction' = ANY(e.poi_roles) AND e.theme_match = 0
+       ORDER BY e.quality_score DESC, COALESCE(e.distance_m, 1e9)
+       LIMIT p_per_area_cap)
+    ) u
+    ORDER BY u.theme_match DESC, u.quality_score DESC, COALESCE(u.distance_m, 1e9)
+    LIMIT p_per_area_cap
+  ) t
+  WHERE 'attraction' = ANY(p_roles) AND p_quota_attraction > 0
+    AND (p_radius_m IS NULL OR (SELECT g FROM seed) IS NULL)
+
+  UNION ALL
+
+  SELECT 'meal'::text, t.*
+  FROM cover c
+  CROSS JOIN LATERAL (
+    SELECT u.* FROM (
+      (SELECT e.* FROM eligible e
+       WHERE e.admin_area_id = c.id AND 'meal' = ANY(e.poi_roles) AND e.theme_match = 1
+       ORDER BY e.quality_score DESC, COALESCE(e.distance_m, 1e9)
+       LIMIT p_per_area_cap)
+      UNION ALL
+      (SELECT e.* FROM eligible e
+       WHERE e.admin_area_id = c.id AND 'meal' = ANY(e.poi_roles) AND e.theme_match = 0
+       ORDER BY e.quality_score DESC, COALESCE(e.distance_m, 1e9)
+       LIMIT p_per_area_cap)
+    ) u
+    ORDER BY u.theme_match DESC, u.quality_score DESC, COALESCE(u.distance_m, 1e9)
+    LIMIT p_per_area_cap
+  ) t
+  WHERE 'meal' = ANY(p_roles) AND p_quota_meal > 0
+    AND (p_radius_m IS NULL OR (SELECT g FROM seed) IS NULL)
+
+  UNION ALL
+
+  SELECT 'accommodation'::text, t.*
+  FROM cover c
+  CROSS JOIN LATERAL (
+    SELECT u.* FROM (
+      (SELECT e.* FROM eligible e
+       WHERE e.admin_area_id = c.id AND 'accommodation' = ANY(e.poi_roles) AND e.theme_match = 1
+       ORDER BY e.quality_score DESC, COALESCE(e.distance_m, 1e9)
+       LIMIT p_per_area_cap)
+      UNION ALL
+      (SELECT e.* FROM eligible e
+       WHERE e.admin_area_id = c.id AND 'accommodation' = ANY(e.poi_roles) AND e.theme_match = 0
+       ORDER BY e.quality_score DESC, COALESCE(e.distance_m, 1e9)
+       LIMIT p_per_area_cap)
+    ) u
+    ORDER BY u.theme_match DESC, u.quality_score DESC, COALESCE(u.distance_m, 1e9)
+    LIMIT p_per_area_cap
+  ) t
+  WHERE 'accommodation' = ANY(p_roles) AND p_quota_accommodation > 0
+    AND (p_radius_m IS NULL OR (SELECT g FROM seed) IS NULL)
 ),
-ranked AS (
-  SELECT
-    s.*,
-    r.role AS role_pick,
-    ROW_NUMBER() OVER (
-      PARTITION BY r.role, s.area_id
-      ORDER BY
-        s.theme_match DESC,
-        s.quality_score DESC,  -- Use quality score (rating + reviews)
-        CASE WHEN s.distance_m IS NULL THEN 1e9 ELSE s.distance_m END ASC
-    ) AS rn_area
-  FROM scored s
-  JOIN unnest(p_roles) AS r(role) ON r.role::text = ANY (s.poi_roles::text[])
+-- Proximity mode: per role, the p_per_area_cap nearest POIs within
+-- p_radius_m of the seed. ST_DWithin and the <-> ordering both run on
+-- idx_pois_geom, so the cost follows the neighbourhood, not the destination.
+near_top AS (
+  SELECT 'attraction'::text AS role_pick, n.*
+  FROM (
+    SELECT e.* FROM eligible e
+    WHERE 'attraction' = ANY(e.poi_roles)
+      AND e.admin_area_id IN (SELECT id FROM cover)
+      AND ST_DWithin(e.geom, (SELECT g FROM seed), p_radius_m)
+    ORDER BY e.geom <-> (SELECT g FROM seed)
+    LIMIT p_per_area_cap
+  ) n
+  WHERE 'attraction' = ANY(p_roles) AND p_quota_attraction > 0
+    AND p_radius_m IS NOT NULL AND (SELECT g FROM seed) IS NOT NULL
+
+  UNION ALL
+
+  SELECT 'meal'::text, n.*
+  FROM (
+    SELECT e.* FROM eligible e
+    WHERE 'meal' = ANY(e.poi_roles)
+      AND e.admin_area_id IN (SELECT id FROM cover)
+      AND ST_DWithin(e.geom, (SELECT g FROM seed), p_radius_m)
+    ORDER BY e.geom <-> (SELECT g FROM seed)
+    LIMIT p_per_area_cap
+  ) n
+  WHERE 'meal' = ANY(p_roles) AND p_quota_meal > 0
+    AND p_radius_m IS NOT NULL AND (SELECT g FROM seed) IS NOT NULL
+
+  UNION ALL
+
+  SELECT 'accommodation'::text, n.*
+  FROM (
+    SELECT e.* FROM eligible e
+    WHERE 'accommodation' = ANY(e.poi_roles)
+      AND e.admin_area_id IN (SELECT id FROM cover)
+      AND ST_DWithin(e.geom, (SELECT g FROM seed), p_radius_m)
+    ORDER BY e.geom <-> (SELECT g FROM seed)
+    LIMIT p_per_area_cap
+  ) n
+  WHERE 'accommodation' = ANY(p_roles) AND p_quota_accommodation > 0
+    AND p_radius_m IS NOT NULL AND (SELECT g FROM seed) IS NOT NULL
 ),
-capped_area AS (
-  SELECT * FROM ranked WHERE rn_area <= p_per_area_cap
+candidates AS (
+  SELECT * FROM area_top
+  UNION ALL
+  SELECT * FROM near_top
 ),
+-- Quotas and de-duplication only ever see the bounded candidate set
 role_quota AS (
   SELECT *,
          ROW_NUMBER() OVER (
            PARTITION BY role_pick
            ORDER BY
              theme_match DESC,
-             quality_score DESC,  -- Use quality score (rating + reviews)
-             CASE WHEN distance_m IS NULL THEN 1e9 ELSE distance_m END ASC
+             rank_score DESC,  -- quality score (rating + reviews), distance-blended near a seed
+             COALESCE(distance_m, 1e9) ASC
          ) AS rn_role
-  FROM capped_area
+  FROM candidates
 ),
 final_rank AS (
   SELECT rq.*,
@@ -206,35 +307,168 @@ final_rank AS (
   FROM role_quota rq
 )
 SELECT
-  id,
-  name,
-  categories,
-  themes,
-  poi_roles,
-  open_hours,
-  review_count,
-  review_rating,
-  latitude,
-  longitude,
+  fr.id,
+  fr.name,
+  fr.categories,
+  -- Themes are only reported for attractions
+  CASE WHEN 'attraction' = ANY(fr.poi_roles) THEN fr.themes ELSE ARRAY[]::theme_key[] END,
+  fr.poi_roles,
+  fr.open_hours,
+  fr.review_count,
+  fr.review_rating,
+  fr.latitude,
+  fr.longitude,
 --   price_level,
-  CASE WHEN p_include_images THEN COALESCE(ARRAY[images[1]], ARRAY[]::text[]) ELSE ARRAY[]::text[] END AS images,
-  kids_friendly,
-  pets_friendly,
-  wheelchair_accessible_entrance,
-  wheelchair_accessible_seating,
-  wheelchair_accessible_toilet,
-  halal_food,
-  vegan_options,
-  vegetarian_options,
-
-  role_pick,
-  area_name,
-  distance_m
-FROM final_rank
-WHERE rn_id = 1
+  CASE WHEN p_include_images THEN COALESCE(ARRAY[fr.images[1]], ARRAY[]::text[]) ELSE ARRAY[]::text[] END AS images,
+  fr.kids_friendly,
+  fr.pets_friendly,
+  fr.wheelchair_accessible_entrance,
+  fr.wheelchair_accessible_seating,
+  fr.wheelchair_accessible_toilet,
+  fr.halal_food,
+  fr.vegan_options,
+  fr.vegetarian_options,
+
+  fr.role_pick,
+  aa.name AS area_name,
+  fr.distance_m
+FROM final_rank fr
+LEFT JOIN admin_areas aa ON aa.id = fr.admin_area_id
+WHERE fr.rn_id = 1
   AND (
-    (role_pick = 'attraction' AND rn_role <= p_quota_attraction)
-    OR (role_pick = 'meal' AND rn_role <= p_quota_meal)
-    OR (role_pick = 'accommodation' AND rn_role <= p_quota_accommodation)
+    (fr.role_pick = 'attraction' AND fr.rn_role <= p_quota_attraction)
+    OR (fr.role_pick = 'meal' AND fr.rn_role <= p_quota_meal)
+    OR (fr.role_pick = 'accommodation' AND fr.rn_role <= p_quota_accommodation)
   );
 $$;
+
+-- ----------------------------------------------------------------------------
+-- Function: rpc_fetch_poi_candidates_batch
+-- ----------------------------------------------------------------------------
+-- One call for a multi-destination trip. Each element of p_destinations:
+--   {"destination": "Penang, Malaysia",
+--    "quota_attraction": 30, "quota_meal": 20, "quota_accommodation": 5,
+--    "seed_lon": 100.33, "seed_lat": 5.41, "radius_m": 3000}   -- seed optional
+-- All three quotas are required (0 skips a role). Filters are shared by all destinations and mean the same as in
+-- rpc_fetch_poi_candidates_quota. Rows are tagged with the destination's
+-- position in p_destinations (destination_idx, 0-based) and its text.
+-- ----------------------------------------------------------------------------
+DROP FUNCTION IF EXISTS rpc_fetch_poi_candidates_batch;
+
+-- Batch entries, returned unchanged once valid: a missing quota would
+-- otherwise read as 0 and silently drop that role for the destination.
+CREATE OR REPLACE FUNCTION check_batch_destinations(p_destinations jsonb)
+RETURNS jsonb
+LANGUAGE plpgsql
+IMMUTABLE
+SET search_path = public
+AS $$
+DECLARE
+  v_req jsonb;
+  v_idx int := 0;
+  v_key text;
+BEGIN
+  IF jsonb_typeof(p_destinations) IS DISTINCT FROM 'array' THEN
+    RAISE EXCEPTION 'p_destinations must be a JSON array, got %', COALESCE(jsonb_typeof(p_destinations), 'NULL');
+  END IF;
+
+  FOR v_req IN SELECT jsonb_array_elements(p_destinations) LOOP
+    IF jsonb_typeof(v_req) <> 'object' OR jsonb_typeof(v_req->'destination') IS DISTINCT FROM 'string' THEN
+      RAISE EXCEPTION 'p_destinations[%] must be an object with a "destination" string', v_idx;
+    END IF;
+    FOREACH v_key IN ARRAY ARRAY['quota_attraction', 'quota_meal', 'quota_accommodation'] LOOP
+      IF jsonb_typeof(v_req->v_key) IS DISTINCT FROM 'number' THEN
+        RAISE EXCEPTION 'p_destinations[%] needs a numeric "%"', v_idx, v_key;
+      END IF;
+      IF (v_req->>v_key)::int < 0 THEN
+        RAISE EXCEPTION 'p_destinations[%] "%" must not be negative, got %', v_idx, v_key, v_req->>v_key;
+      END IF;
+    END LOOP;
+    v_idx := v_idx + 1;
+  END LOOP;
+  RETURN p_destinations;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION rpc_fetch_poi_candidates_batch(
+  p_destinations jsonb,
+  p_themes text[],
+
+  p_roles text[] DEFAULT ARRAY['attraction','meal','accommodation'],
+  p_min_rating numeric DEFAULT 2.0,
+  p_min_reviews int DEFAULT 10,
+  p_per_area_cap int DEFAULT 150,
+  p_halal_only boolean DEFAULT false,
+  p_vegetarian_only boolean DEFAULT false,
+  p_vegan_only boolean DEFAULT false,
+  p_wheelchair_only boolean DEFAULT false,
+  p_kids_friendly_only boolean DEFAULT false,
+  p_pets_friendly_only boolean DEFAULT false,
+  p_include_images boolean DEFAULT true,
+  p_excluded_themes text[] DEFAULT NULL,
+  p_proximity_weight double precision DEFAULT 0.5
+)
+RETURNS TABLE (
+  destination_idx int,
+  destination text,
+
+  id uuid,
+  name text,
+  categories text[],
+  themes theme_key[],
+  roles poi_role[],
+  open_hours jsonb,
+  review_count int,
+  review_rating numeric,
+  latitude double precision,
+  longitude double precision,
+  images text[],
+
+  kids_friendly boolean,
+  pets_friendly boolean,
+  wheelchair_accessible_entrance boolean,
+  wheelchair_accessible_seating boolean,
+  wheelchair_accessible_toilet boolean,
+  halal_food boolean,
+  vegan_options boolean,
+  vegetarian_options boolean,
+
+  role_pick text,
+  area_name text,
+  distance_m double precision
+)
+LANGUAGE sql
+STABLE
+SET search_path = public
+AS
+$$
+SELECT
+  (d.ord - 1)::int,
+  d.req->>'destination',
+  c.*
+FROM jsonb_array_elements(check_batch_destinations(p_destinations)) WITH ORDINALITY AS d(req, ord)
+CROSS JOIN LATERAL rpc_fetch_poi_candidates_quota(
+  p_destination         => d.req->>'destination',
+  p_themes              => p_themes,
+  p_quota_attraction    => (d.req->>'quota_attraction')::int,
+  p_quota_meal          => (d.req->>'quota_meal')::int,
+  p_quota_accommodation => (d.req->>'quota_accommodation')::int,
+  p_roles               => p_roles,
+  p_min_rating          => p_min_rating,
+  p_min_reviews         => p_min_reviews,
+  p_per_area_cap        => p_per_area_cap,
+  p_halal_only          => p_halal_only,
+  p_vegetarian_only     => p_vegetarian_only,
+  p_vegan_only          => p_vegan_only,
+  p_wheelchair_only     => p_wheelchair_only,
+  p_kids_friendly_only  => p_kids_friendly_only,
+  p_pets_friendly_only  => p_pets_friendly_only,
+  p_include_images      => p_include_images,
+  p_excluded_themes     => p_excluded_themes,
+  p_seed_lon            => (d.req->>'seed_lon')::numeric,
+  p_seed_lat            => (d.req->>'seed_lat')::numeric,
+  p_radius_m            => (d.req->>'radius_m')::double precision,
+  p_proximity_weight    => p_proximity_weight
+) AS c
+ORDER BY d.ord;
+$$;
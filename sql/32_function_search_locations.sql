@@ -11,13 +11,17 @@ AS $$
   END;
 $$;
 
--- Create trigram index for admin areas
-CREATE INDEX IF NOT EXISTS admin_areas_name_trgm ON admin_areas USING GIN (lower(name) gin_trgm_ops);
+-- Superseded by admin_area_aliases_key_trgm
+DROP INDEX IF EXISTS admin_areas_name_trgm;
 
 -- Drop old function
 DROP FUNCTION IF EXISTS rpc_search_locations;
 
--- Updated admin areas search function
+-- Admin area typeahead over names and aliases. An exact alias match comes
+-- first, picked as resolve_destination() picks it, so a complete name tops
+-- the list with the destination the other RPCs will use; then prefix
+-- matches, then the most similar. Runs on every keystroke, so it never calls
+-- the fuzzy resolver itself.
 CREATE OR REPLACE FUNCTION rpc_search_locations(
   p_query text,
   p_limit int DEFAULT 5
@@ -35,7 +39,24 @@ LANGUAGE sql
 STABLE
 SET search_path = public
 AS $$
-  SELECT DISTINCT ON (a.id)
+  WITH q AS (
+    SELECT normalize_place_name(p_query) AS k,
+           lookup_destination_alias(normalize_place_name(p_query)) AS exact_id
+  ),
+  hits AS (
+    SELECT DISTINCT ON (al.area_id)
+      al.area_id,
+      CASE WHEN al.alias_key LIKE q.k || '%' THEN 0 ELSE 1 END AS prefix_rank,
+      similarity(al.alias_key, q.k) AS sim
+    FROM admin_area_aliases al, q
+    WHERE al.alias_key LIKE q.k || '%'
+       OR al.alias_key % q.k
+       OR al.area_id = q.exact_id
+    ORDER BY al.area_id,
+             CASE WHEN al.alias_key LIKE q.k || '%' THEN 0 ELSE 1 END,
+             similarity(al.alias_key, q.k) DESC
+  )
+  SELECT
     a.id,
     a.name,
     CASE 
@@ -47,15 +68,13 @@ AS $$
     a.country_iso2,
     a.parent_id,
     a.admin_level
-  FROM admin_areas a
-  WHERE
-    lower(a.name) % lower(p_query)
-    OR lower(a.name) LIKE lower(p_query) || '%'
+  FROM hits h
+  JOIN admin_areas a ON a.id = h.area_id
+  CROSS JOIN q
   ORDER BY
-    a.id,
-    CASE WHEN lower(a.name) LIKE lower(p_query) || '%'
-         THEN 0 ELSE 1 END,
-    similarity(lower(a.name), lower(p_query)) DESC,
+    CASE WHEN a.id = q.exact_id THEN 0 ELSE 1 END,
+    h.prefix_rank,
+    h.sim DESC,
     length(a.name)
   LIMIT p_limit;
 $$;
@@ -2,7 +2,66 @@
 ALTER TABLE pois DROP COLUMN IF EXISTS name_i18n;
 DROP INDEX IF EXISTS pois_name_i18n_trgm;
 
+-- Trigram indexes for search_minimal: GiST so `<->` can be index-ordered
+-- (nearest names first) as well as serve `%` and prefix LIKE
+CREATE INDEX IF NOT EXISTS pois_name_trgm ON pois USING GIST (lower(name) gist_trgm_ops);
+CREATE INDEX IF NOT EXISTS pois_category_trgm ON pois USING GIST (lower(categories[1]) gist_trgm_ops);
+
+-- Search box text as a prefix-matching tsquery for pois.search_doc: every
+-- word must match, each as a prefix ('sushi ze' -> 'sushi':* & 'ze':*).
+-- NULL when the text has no words.
+CREATE OR REPLACE FUNCTION poi_search_query(p_query text)
+RETURNS tsquery
+LANGUAGE sql
+STABLE
+SET search_path = public
+AS $$
+  SELECT to_tsquery('simple', string_agg(quote_literal(w) || ':*', ' & ' ORDER BY n))
+  FROM regexp_split_to_table(lower(unaccent(COALESCE(p_query, ''))), '[^[:alnum:]]+')
+       WITH ORDINALITY AS t(w, n)
+  WHERE w <> '';
+$$;
+
+-- Keyset order of list mode: review_count DESC NULLS LAST,
+-- review_rating DESC NULLS LAST, id DESC (ratings and counts are never negative)
+CREATE INDEX IF NOT EXISTS idx_pois_review_keyset
+  ON pois ((COALESCE(review_count, -1)) DESC, (COALESCE(review_rating, -1)) DESC, id DESC);
+
+-- Planner estimate of the rows rpc_search_pois would count, for p_count => 'estimated'
+CREATE OR REPLACE FUNCTION estimate_pois_count(
+  p_area_ids uuid[],
+  p_roles text[],
+  p_tsquery tsquery
+) RETURNS bigint
+LANGUAGE plpgsql
+VOLATILE
+SET search_path = public
+AS $$
+DECLARE
+  v_plan jsonb;
+BEGIN
+  EXECUTE format(
+    'EXPLAIN (FORMAT JSON) SELECT 1 FROM pois p
+     WHERE (%1$L::uuid[] IS NULL OR p.admin_area_id = ANY(%1$L::uuid[]))
+       AND (%2$L::text[] IS NULL OR p.poi_roles::text[] && %2$L::text[])
+       AND (%3$L::tsquery IS NULL OR p.search_doc @@ %3$L::tsquery)',
+    p_area_ids, p_roles, p_tsquery
+  ) INTO v_plan;
+  RETURN (v_plan -> 0 -> 'Plan' ->> 'Plan Rows')::bigint;
+END;
+$$;
+
+-- Internal: runs dynamic EXPLAIN; rpc_search_pois is SECURITY DEFINER to call it
+REVOKE EXECUTE ON FUNCTION estimate_pois_count FROM PUBLIC, anon, authenticated;
+
 -- POI search function
+--
+-- list / search page with a keyset cursor: pass the last row's search_rank
+-- (search mode only), review_count, review_rating and id as p_after_* to get
+-- the next page. p_offset still works but costs more the deeper it goes.
+-- p_count: 'exact' (COUNT(*)), 'estimated' (planner estimate) or 'none'.
+-- SECURITY DEFINER only so it can call estimate_pois_count; everything it
+-- reads is public already.
 DROP FUNCTION IF EXISTS rpc_search_pois;
 
 CREATE OR REPLACE FUNCTION rpc_search_pois(
@@ -11,7 +70,12 @@ CREATE OR REPLACE FUNCTION rpc_search_pois(
   p_roles text[] DEFAULT NULL,
   p_query text DEFAULT NULL,
   p_limit integer DEFAULT 5,
-  p_offset integer DEFAULT 0
+  p_offset integer DEFAULT 0,
+  p_after_rank real DEFAULT NULL,
+  p_after_review_count integer DEFAULT NULL,
+  p_after_review_rating numeric DEFAULT NULL,
+  p_after_id uuid DEFAULT NULL,
+  p_count text DEFAULT 'exact'
 ) RETURNS TABLE (
   id uuid,
   name text,
@@ -42,70 +106,102 @@ CREATE OR REPLACE FUNCTION rpc_search_pois(
   vegan_options boolean,
   vegetarian_options boolean,
 
+  search_rank real,
   total_count bigint
 )
 LANGUAGE plpgsql
 STABLE
+SECURITY DEFINER
 SET search_path = public
 AS $$
 DECLARE
   v_dest_id uuid;
-  v_dest_kind text;
-  v_area_name text;
-  v_country_part text;
   v_search_areas uuid[];
   v_total_count bigint;
+  v_tsquery tsquery;
+  v_q text;
+  v_prefix text;
+  v_ids uuid[];
 BEGIN
-  -- Parse destination (same as before)
+  -- Destination via the shared resolver (aliases, "Place, Country")
   IF p_destination IS NOT NULL THEN
-    v_area_name := trim(split_part(p_destination, ',', 1));
-    
-    IF p_destination LIKE '%,%' THEN
-      v_country_part := NULLIF(trim(split_part(p_destination, ',', 2)), '');
-    END IF;
-    
-    SELECT a.id, a.kind INTO v_dest_id, v_dest_kind
-    FROM admin_areas a
-    WHERE (
-      lower(a.name) = lower(v_area_name)
-      OR (v_country_part IS NOT NULL AND a.kind = 'country' AND 
-          (lower(a.name) = lower(v_country_part) OR a.country_iso2 = upper(v_country_part)))
-    )
-    ORDER BY 
-      CASE WHEN lower(a.name) = lower(v_area_name) THEN 1 ELSE 2 END,
-      CASE WHEN a.kind = 'state' THEN 2 WHEN a.kind = 'country' THEN 3 ELSE 4 END
-    LIMIT 1;
-    
+    v_dest_id := resolve_destination(p_destination);
     IF v_dest_id IS NULL THEN
       RETURN;
     END IF;
     
-    IF v_dest_kind = 'country' THEN
-      SELECT array_agg(aa.id) INTO v_search_areas
-      FROM admin_areas aa
-      WHERE aa.id = v_dest_id OR aa.parent_id = v_dest_id;
-    ELSE
-      v_search_areas := ARRAY[v_dest_id];
-    END IF;
+    -- The destination and every area below it
+    SELECT array_agg(c.descendant_id) INTO v_search_areas
+    FROM admin_area_closure c
+    WHERE c.ancestor_id = v_dest_id;
   END IF;
   
   -- MODE: list or search
   IF p_mode IN ('list', 'search') THEN
-    -- First, get total count
-    SELECT COUNT(*) INTO v_total_count
-    FROM pois p
-    WHERE 
-      (p_destination IS NULL OR p.admin_area_id = ANY(v_search_areas))
-      AND (p_roles IS NULL OR p.poi_roles::text[] && p_roles)
-      AND (
-        p_mode = 'list'
-        OR p_query IS NULL
-        OR lower(p.name) ILIKE '%' || lower(p_query) || '%'
-        OR lower(p.descriptions) ILIKE '%' || lower(p_query) || '%'
-        OR lower(p.address) ILIKE '%' || lower(p_query) || '%'
-      );
-    
-    -- Then return paginated results with count
+    -- Search ranks full-text matches on pois.search_doc (idx_pois_search_doc)
+    IF p_mode = 'search' THEN
+      v_tsquery := poi_search_query(p_query);
+    END IF;
+    -- Ranked pages are ordered by search_rank first; without it the cursor
+    -- comparison is NULL and the next page would come back empty
+    IF v_tsquery IS NOT NULL AND p_after_id IS NOT NULL AND p_after_rank IS NULL THEN
+      RAISE EXCEPTION 'p_after_rank is required with p_after_id in search mode (pass the last row''s search_rank)';
+    END IF;
+
+    IF p_count = 'exact' THEN
+      SELECT COUNT(*) INTO v_total_count
+      FROM pois p
+      WHERE 
+        (p_destination IS NULL OR p.admin_area_id = ANY(v_search_areas))
+        AND (p_roles IS NULL OR p.poi_roles::text[] && p_roles)
+        AND (
+          v_tsquery IS NULL OR p.search_doc @@ v_tsquery
+        );
+    ELSIF p_count = 'estimated' THEN
+      v_total_count := estimate_pois_count(v_search_areas, p_roles, v_tsquery);
+    ELSIF p_count <> 'none' THEN
+      RAISE EXCEPTION 'p_count must be exact, estimated or none, got %', p_count;
+    END IF;
+
+    -- Page ids in order. Unranked pages walk idx_pois_review_keyset from
+    -- the cursor; ranked pages must rank every match first.
+    IF v_tsquery IS NULL THEN
+      SELECT array_agg(p.id ORDER BY p.k1 DESC, p.k2 DESC, p.id DESC) INTO v_ids
+      FROM (
+        SELECT p.id, COALESCE(p.review_count, -1) AS k1, COALESCE(p.review_rating, -1) AS k2
+        FROM pois p
+        WHERE 
+          (p_destination IS NULL OR p.admin_area_id = ANY(v_search_areas))
+          AND (p_roles IS NULL OR p.poi_roles::text[] && p_roles)
+          AND (
+            p_after_id IS NULL
+            OR (COALESCE(p.review_count, -1), COALESCE(p.review_rating, -1), p.id)
+               < (COALESCE(p_after_review_count, -1), COALESCE(p_after_review_rating, -1), p_after_id)
+          )
+        ORDER BY COALESCE(p.review_count, -1) DESC, COALESCE(p.review_rating, -1) DESC, p.id DESC
+        LIMIT p_limit OFFSET p_offset
+      ) p;
+    ELSE
+      SELECT array_agg(p.id ORDER BY p.r DESC, p.k1 DESC, p.k2 DESC, p.id DESC) INTO v_ids
+      FROM (
+        SELECT p.id, ts_rank(p.search_doc, v_tsquery) AS r,
+               COALESCE(p.review_count, -1) AS k1, COALESCE(p.review_rating, -1) AS k2
+        FROM pois p
+        WHERE 
+          (p_destination IS NULL OR p.admin_area_id = ANY(v_search_areas))
+          AND (p_roles IS NULL OR p.poi_roles::text[] && p_roles)
+          AND p.search_doc @@ v_tsquery
+          AND (
+            p_after_id IS NULL
+            OR (ts_rank(p.search_doc, v_tsquery), COALESCE(p.review_count, -1), COALESCE(p.review_rating, -1), p.id)
+               < (p_after_rank, COALESCE(p_after_review_count, -1), COALESCE(p_after_review_rating, -1), p_after_id)
+          )
+        ORDER BY r DESC, k1 DESC, k2 DESC, p.id DESC
+        LIMIT p_limit OFFSET p_offset
+      ) p;
+    END IF;
+
+    -- Then return the page with its count
     RETURN QUERY
     SELECT 
       fp.id,
@@ -137,55 +233,85 @@ BEGIN
       fp.vegan_options boolean,
       fp.vegetarian_options boolean,
 
+      CASE WHEN v_tsquery IS NULL THEN NULL::real ELSE ts_rank(fp.search_doc, v_tsquery) END,
       v_total_count
-    FROM (
-      SELECT p.*
-      FROM pois p
-      WHERE 
-        (p_destination IS NULL OR p.admin_area_id = ANY(v_search_areas))
-        AND (p_roles IS NULL OR p.poi_roles::text[] && p_roles)
-        AND (
-          p_mode = 'list'
-          OR p_query IS NULL
-          OR lower(p.name) ILIKE '%' || lower(p_query) || '%'
-          OR lower(p.descriptions) ILIKE '%' || lower(p_query) || '%'
-          OR lower(p.address) ILIKE '%' || lower(p_query) || '%'
-        )
-      ORDER BY p.review_count DESC NULLS LAST, p.review_rating DESC NULLS LAST
-      LIMIT p_limit OFFSET p_offset
-    ) fp;
+    FROM unnest(v_ids) WITH ORDINALITY AS u(id, ord)
+    JOIN pois fp ON fp.id = u.id
+    ORDER BY u.ord;
     
   -- MODE: search_minimal (no pagination, no count needed)
   ELSIF p_mode = 'search_minimal' THEN
+    v_q := NULLIF(lower(trim(p_query)), '');
+    -- LIKE pattern for names starting with the query, wildcards escaped
+    v_prefix := replace(replace(replace(v_q, '\', '\\'), '%', '\%'), '_', '\_') || '%';
+
+    IF v_q IS NULL THEN
+      SELECT array_agg(p.id) INTO v_ids
+      FROM (
+        SELECT p.id
+        FROM pois p
+        WHERE 
+          (p_destination IS NULL OR p.admin_area_id = ANY(v_search_areas))
+          AND (p_roles IS NULL OR p.poi_roles::text[] && p_roles)
+        ORDER BY p.review_rating DESC NULLS LAST, p.review_count DESC NULLS LAST
+        LIMIT p_limit
+      ) p;
+    ELSE
+      -- Prefix fast path: names starting with the query, nearest first by
+      -- pois_name_trgm. A full page of them outranks any fuzzy match.
+      SELECT array_agg(p.id) INTO v_ids
+      FROM (
+        SELECT p.id
+        FROM pois p
+        WHERE 
+          lower(p.name) LIKE v_prefix
+          AND (p_destination IS NULL OR p.admin_area_id = ANY(v_search_areas))
+          AND (p_roles IS NULL OR p.poi_roles::text[] && p_roles)
+        ORDER BY lower(p.name) <-> v_q
+        LIMIT p_limit
+      ) p;
+
+      IF COALESCE(cardinality(v_ids), 0) < p_limit THEN
+        -- Otherwise add the nearest fuzzy name and first-category matches,
+        -- each an index-ordered KNN scan stopping after p_limit rows
+        SELECT array_agg(DISTINCT m.id) INTO v_ids
+        FROM (
+          SELECT unnest(v_ids) AS id
+          UNION ALL
+          (SELECT p.id
+           FROM pois p
+           WHERE 
+             lower(p.name) % v_q
+             AND (p_destination IS NULL OR p.admin_area_id = ANY(v_search_areas))
+             AND (p_roles IS NULL OR p.poi_roles::text[] && p_roles)
+           ORDER BY lower(p.name) <-> v_q
+           LIMIT p_limit)
+          UNION ALL
+          (SELECT p.id
+           FROM pois p
+           WHERE 
+             lower(p.categories[1]) % v_q
+             AND (p_destination IS NULL OR p.admin_area_id = ANY(v_search_areas))
+             AND (p_roles IS NULL OR p.poi_roles::text[] && p_roles)
+           ORDER BY lower(p.categories[1]) <-> v_q
+           LIMIT p_limit)
+        ) m;
+      END IF;
+    END IF;
+
     RETURN QUERY
-    WITH filtered_pois AS (
-      SELECT p.*
-      FROM pois p
-      WHERE 
-        (p_destination IS NULL OR p.admin_area_id = ANY(v_search_areas))
-        AND (p_roles IS NULL OR p.poi_roles::text[] && p_roles)
-        AND (
-          p_query IS NULL
-          OR lower(p.name) % lower(p_query)
-          OR lower(p.name) LIKE lower(p_query) || '%'
-          OR (p.categories IS NOT NULL AND array_length(p.categories, 1) > 0 AND 
-              lower(p.categories[1]) % lower(p_query))
-        )
-    ),
-    with_themes AS (
+    WITH with_themes AS (
       SELECT 
-        fp.*,
-        COALESCE((
-          SELECT array_agg(DISTINCT m.theme)::theme_key[]
-          FROM unnest(fp.categories) AS c
-          JOIN theme_category_map m ON m.category = c
-        ), ARRAY[]::theme_key[]) AS themes,
-        CASE WHEN p_query IS NULL THEN 0
-             ELSE similarity(lower(fp.name), lower(p_query)) END AS sim_name,
-        CASE WHEN p_query IS NULL THEN 0
-             WHEN lower(fp.name) LIKE lower(p_query) || '%' THEN 1
+        p.*,
+        CASE WHEN v_q IS NULL THEN 0
+             ELSE similarity(lower(p.name), v_q) END AS sim_name,
+        CASE WHEN v_q IS NULL THEN 0
+             ELSE COALESCE(similarity(lower(p.categories[1]), v_q), 0) END AS sim_category,
+        CASE WHEN v_q IS NULL THEN 0
+             WHEN lower(p.name) LIKE v_prefix THEN 1
              ELSE 0 END AS has_prefix
-      FROM filtered_pois fp
+      FROM pois p
+      WHERE p.id = ANY(v_ids)
     )
     SELECT 
       wt.id,
@@ -218,10 +344,10 @@ BEGIN
       wt.vegan_options,
       wt.vegetarian_options,
 
+      NULL::real,
       NULL::bigint  -- no total count for minimal
     FROM with_themes wt
-    WHERE p_query IS NULL OR wt.sim_name > 0
-    ORDER BY wt.has_prefix DESC, wt.sim_name DESC, 
+    ORDER BY wt.has_prefix DESC, wt.sim_name DESC, wt.sim_category DESC,
              wt.review_rating DESC NULLS LAST, wt.review_count DESC NULLS LAST
     LIMIT p_limit;
   END IF;
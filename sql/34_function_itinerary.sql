@@ -315,7 +315,12 @@ $$;
 -- ----------------------------------------------------------------------------
 -- Function: rpc_list_user_itineraries
 -- ----------------------------------------------------------------------------
--- Lists itineraries for a user with pagination.
+-- Lists itineraries for a user, most recently updated first.
+--
+-- Pagination: pass the last row's updated_at and id as p_after_updated_at /
+-- p_after_id for the next page (keyset on idx_itineraries_user_updated_at,
+-- same cost at any depth). p_offset is kept for older clients.
+-- p_count: 'exact' (COUNT(*)), 'estimated' (planner estimate) or 'none'.
 --
 -- Returns: id, title, destinations, dates, status, created_at, updated_at, total_count
 -- ----------------------------------------------------------------------------
@@ -323,7 +328,10 @@ CREATE OR REPLACE FUNCTION rpc_list_user_itineraries(
     p_user_id UUID,
     p_status TEXT DEFAULT 'active',
     p_limit INT DEFAULT 20,
-    p_offset INT DEFAULT 0
+    p_offset INT DEFAULT 0,
+    p_after_updated_at TIMESTAMPTZ DEFAULT NULL,
+    p_after_id UUID DEFAULT NULL,
+    p_count TEXT DEFAULT 'exact'
 )
 RETURNS TABLE (
     id UUID,
@@ -342,11 +350,23 @@ AS $$
 DECLARE
     v_total BIGINT;
 BEGIN
+    -- A cursor needs both halves; with one missing the keyset comparison is
+    -- NULL and the page would come back empty
+    IF (p_after_id IS NULL) <> (p_after_updated_at IS NULL) THEN
+        RAISE EXCEPTION 'p_after_updated_at and p_after_id must be given together (the last row''s updated_at and id)';
+    END IF;
+
     -- Get total count
-    SELECT COUNT(*) INTO v_total
-    FROM itineraries i
-    WHERE i.user_id = p_user_id
-      AND (p_status IS NULL OR i.status = p_status);
+    IF p_count = 'exact' THEN
+        SELECT COUNT(*) INTO v_total
+        FROM itineraries i
+        WHERE i.user_id = p_user_id
+          AND (p_status IS NULL OR i.status = p_status);
+    ELSIF p_count = 'estimated' THEN
+        v_total := estimate_itineraries_count(p_user_id, p_status);
+    ELSIF p_count <> 'none' THEN
+        RAISE EXCEPTION 'p_count must be exact, estimated or none, got %', p_count;
+    END IF;
 
     -- Return paginated results
     RETURN QUERY
@@ -362,7 +382,8 @@ BEGIN
     FROM itineraries i
     WHERE i.user_id = p_user_id
       AND (p_status IS NULL OR i.status = p_status)
-    ORDER BY i.updated_at DESC
+      AND (p_after_id IS NULL OR (i.updated_at, i.id) < (p_after_updated_at, p_after_id))
+    ORDER BY i.updated_at DESC, i.id DESC
     LIMIT p_limit
     OFFSET p_offset;
 END;
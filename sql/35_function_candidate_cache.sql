@@ -0,0 +1,522 @@
+DROP FUNCTION IF EXISTS rpc_fetch_poi_candidates_cached;
+DROP FUNCTION IF EXISTS refresh_poi_candidate_cache;
+
+-- ----------------------------------------------------------------------------
+-- Data version
+-- ----------------------------------------------------------------------------
+-- A counter bumped by every transaction that writes the tables candidate
+-- results are built from; the version is the sum over all shards. Writers
+-- bump the shard picked by their backend pid, so concurrent loader sessions
+-- rarely wait on each other's row lock. Cache entries remember the version
+-- they were built at and are ignored once it moves on.
+--
+-- Both tables are rebuilt whenever this file is applied. The runner re-applies
+-- it after any earlier file changes, including a rebuild of pois, so entries
+-- cached against the previous tables never survive.
+-- ----------------------------------------------------------------------------
+DROP TABLE IF EXISTS poi_data_version;
+CREATE TABLE poi_data_version (
+  shard smallint PRIMARY KEY,
+  version bigint NOT NULL DEFAULT 0,
+  bumped_at timestamptz NOT NULL DEFAULT now()
+);
+INSERT INTO poi_data_version (shard) SELECT generate_series(0, 15);
+
+ALTER TABLE poi_data_version ENABLE ROW LEVEL SECURITY;
+DROP POLICY IF EXISTS "Allow public read access" ON poi_data_version;
+CREATE POLICY "Allow public read access" ON poi_data_version FOR SELECT USING (true);
+
+-- Bumps only when the statement changed rows: INSERT/DELETE with at least one
+-- row, UPDATE with at least one row that differs from before. Trigger
+-- arguments name the columns candidate results depend on; an UPDATE touching
+-- none of them is ignored, and without arguments whole rows are compared.
+-- Re-running an idempotent data step (20_link_admin_areas.sql,
+-- 22_admin_area_aliases.sql) therefore keeps the cache. A transaction bumps
+-- at most once. Transition tables need one trigger per event.
+CREATE OR REPLACE FUNCTION bump_poi_data_version()
+RETURNS trigger
+LANGUAGE plpgsql
+SET search_path = public
+AS $$
+DECLARE
+  v_cols text;
+  v_changed boolean;
+BEGIN
+  IF current_setting('fika.data_version_bumped', true) = 'on' THEN
+    RETURN NULL;
+  END IF;
+
+  IF TG_OP = 'INSERT' THEN
+    IF NOT EXISTS (SELECT 1 FROM new_rows) THEN
+      RETURN NULL;
+    END IF;
+  ELSIF TG_OP = 'DELETE' THEN
+    IF NOT EXISTS (SELECT 1 FROM old_rows) THEN
+      RETURN NULL;
+    END IF;
+  ELSIF TG_OP = 'UPDATE' THEN
+    IF TG_NARGS > 0 THEN
+      SELECT string_agg(format('%I', a), ', ') INTO v_cols FROM unnest(TG_ARGV) AS a;
+      EXECUTE format(
+        'SELECT EXISTS (SELECT %1$s FROM new_rows EXCEPT SELECT %1$s FROM old_rows)',
+        v_cols
+      ) INTO v_changed;
+    ELSE
+      v_changed := EXISTS (
+        SELECT n::text FROM new_rows n
+        EXCEPT
+        SELECT o::text FROM old_rows o
+      );
+    END IF;
+    IF NOT v_changed THEN
+      RETURN NULL;
+    END IF;
+  END IF;
+
+  UPDATE poi_data_version
+  SET version = version + 1, bumped_at = now()
+  WHERE shard = pg_backend_pid() % 16;
+  PERFORM set_config('fika.data_version_bumped', 'on', true);
+  RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_pois_bump_data_version ON pois;
+DROP TRIGGER IF EXISTS trg_pois_bump_data_version_ins ON pois;
+CREATE TRIGGER trg_pois_bump_data_version_ins
+AFTER INSERT ON pois
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION bump_poi_data_version();
+DROP TRIGGER IF EXISTS trg_pois_bump_data_version_upd ON pois;
+-- POI columns are read back from pois on a hit, so only the columns that
+-- decide which POIs are picked and in what order matter here
+CREATE TRIGGER trg_pois_bump_data_version_upd
+AFTER UPDATE ON pois
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION bump_poi_data_version(
+  'id', 'geom', 'poi_roles', 'themes', 'review_rating', 'review_count', 'quality_score', 'admin_area_id',
+  'halal_food', 'vegetarian_options', 'vegan_options', 'kids_friendly', 'pets_friendly',
+  'wheelchair_accessible_entrance', 'wheelchair_accessible_seating', 'wheelchair_accessible_toilet'
+);
+DROP TRIGGER IF EXISTS trg_pois_bump_data_version_del ON pois;
+CREATE TRIGGER trg_pois_bump_data_version_del
+AFTER DELETE ON pois
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION bump_poi_data_version();
+DROP TRIGGER IF EXISTS trg_pois_bump_data_version_trunc ON pois;
+CREATE TRIGGER trg_pois_bump_data_version_trunc
+AFTER TRUNCATE ON pois
+FOR EACH STATEMENT
+EXECUTE FUNCTION bump_poi_data_version();
+
+DROP TRIGGER IF EXISTS trg_tcm_bump_data_version ON theme_category_map;
+DROP TRIGGER IF EXISTS trg_tcm_bump_data_version_ins ON theme_category_map;
+CREATE TRIGGER trg_tcm_bump_data_version_ins
+AFTER INSERT ON theme_category_map
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION bump_poi_data_version();
+DROP TRIGGER IF EXISTS trg_tcm_bump_data_version_upd ON theme_category_map;
+CREATE TRIGGER trg_tcm_bump_data_version_upd
+AFTER UPDATE ON theme_category_map
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION bump_poi_data_version();
+DROP TRIGGER IF EXISTS trg_tcm_bump_data_version_del ON theme_category_map;
+CREATE TRIGGER trg_tcm_bump_data_version_del
+AFTER DELETE ON theme_category_map
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION bump_poi_data_version();
+DROP TRIGGER IF EXISTS trg_tcm_bump_data_version_trunc ON theme_category_map;
+CREATE TRIGGER trg_tcm_bump_data_version_trunc
+AFTER TRUNCATE ON theme_category_map
+FOR EACH STATEMENT
+EXECUTE FUNCTION bump_poi_data_version();
+
+DROP TRIGGER IF EXISTS trg_crm_bump_data_version ON category_role_map;
+DROP TRIGGER IF EXISTS trg_crm_bump_data_version_ins ON category_role_map;
+CREATE TRIGGER trg_crm_bump_data_version_ins
+AFTER INSERT ON category_role_map
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION bump_poi_data_version();
+DROP TRIGGER IF EXISTS trg_crm_bump_data_version_upd ON category_role_map;
+CREATE TRIGGER trg_crm_bump_data_version_upd
+AFTER UPDATE ON category_role_map
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION bump_poi_data_version();
+DROP TRIGGER IF EXISTS trg_crm_bump_data_version_del ON category_role_map;
+CREATE TRIGGER trg_crm_bump_data_version_del
+AFTER DELETE ON category_role_map
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION bump_poi_data_version();
+DROP TRIGGER IF EXISTS trg_crm_bump_data_version_trunc ON category_role_map;
+CREATE TRIGGER trg_crm_bump_data_version_trunc
+AFTER TRUNCATE ON category_role_map
+FOR EACH STATEMENT
+EXECUTE FUNCTION bump_poi_data_version();
+
+-- Area names and hierarchy are part of the result too
+DROP TRIGGER IF EXISTS trg_admin_areas_bump_data_version ON admin_areas;
+DROP TRIGGER IF EXISTS trg_admin_areas_bump_data_version_ins ON admin_areas;
+CREATE TRIGGER trg_admin_areas_bump_data_version_ins
+AFTER INSERT ON admin_areas
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION bump_poi_data_version();
+DROP TRIGGER IF EXISTS trg_admin_areas_bump_data_version_upd ON admin_areas;
+CREATE TRIGGER trg_admin_areas_bump_data_version_upd
+AFTER UPDATE ON admin_areas
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION bump_poi_data_version('id', 'name', 'parent_id');
+DROP TRIGGER IF EXISTS trg_admin_areas_bump_data_version_del ON admin_areas;
+CREATE TRIGGER trg_admin_areas_bump_data_version_del
+AFTER DELETE ON admin_areas
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION bump_poi_data_version();
+DROP TRIGGER IF EXISTS trg_admin_areas_bump_data_version_trunc ON admin_areas;
+CREATE TRIGGER trg_admin_areas_bump_data_version_trunc
+AFTER TRUNCATE ON admin_areas
+FOR EACH STATEMENT
+EXECUTE FUNCTION bump_poi_data_version();
+
+-- As is which area a destination string resolves to
+DROP TRIGGER IF EXISTS trg_aliases_bump_data_version ON admin_area_aliases;
+DROP TRIGGER IF EXISTS trg_aliases_bump_data_version_ins ON admin_area_aliases;
+CREATE TRIGGER trg_aliases_bump_data_version_ins
+AFTER INSERT ON admin_area_aliases
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION bump_poi_data_version();
+DROP TRIGGER IF EXISTS trg_aliases_bump_data_version_upd ON admin_area_aliases;
+CREATE TRIGGER trg_aliases_bump_data_version_upd
+AFTER UPDATE ON admin_area_aliases
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION bump_poi_data_version();
+DROP TRIGGER IF EXISTS trg_aliases_bump_data_version_del ON admin_area_aliases;
+CREATE TRIGGER trg_aliases_bump_data_version_del
+AFTER DELETE ON admin_area_aliases
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION bump_poi_data_version();
+DROP TRIGGER IF EXISTS trg_aliases_bump_data_version_trunc ON admin_area_aliases;
+CREATE TRIGGER trg_aliases_bump_data_version_trunc
+AFTER TRUNCATE ON admin_area_aliases
+FOR EACH STATEMENT
+EXECUTE FUNCTION bump_poi_data_version();
+
+-- ----------------------------------------------------------------------------
+-- Candidate cache
+-- ----------------------------------------------------------------------------
+-- One row per normalized parameter set: the ranked result as
+-- [{id, role_pick, area_name, distance_m}, ...]. POI columns are read back
+-- from pois on a hit, which is safe because the data version still matches.
+-- ----------------------------------------------------------------------------
+DROP TABLE IF EXISTS poi_candidate_cache;
+CREATE TABLE poi_candidate_cache (
+  cache_key text PRIMARY KEY,
+  params jsonb NOT NULL,
+  data_version bigint NOT NULL,
+  entries jsonb NOT NULL,
+  created_at timestamptz NOT NULL DEFAULT now(),
+  expires_at timestamptz NOT NULL,
+  hits bigint NOT NULL DEFAULT 0,
+  last_hit_at timestamptz
+);
+CREATE INDEX poi_candidate_cache_hits_idx ON poi_candidate_cache (hits DESC);
+CREATE INDEX poi_candidate_cache_created_idx ON poi_candidate_cache (created_at);
+
+-- No policies: only the SECURITY DEFINER functions below touch it
+ALTER TABLE poi_candidate_cache ENABLE ROW LEVEL SECURITY;
+
+-- ----------------------------------------------------------------------------
+-- Function: rpc_fetch_poi_candidates_cached
+-- ----------------------------------------------------------------------------
+-- Same parameters and result as rpc_fetch_poi_candidates_quota. The key is
+-- an md5 of the parameters with the destination lower-cased and array
+-- arguments sorted and de-duplicated, so equivalent calls share an entry. A
+-- miss (absent, expired or older data version) runs the full function and,
+-- unless the caller is anonymous, stores its result for an hour; the oldest
+-- entries beyond 5000 are evicted on a sample of stores. Hits are read-only
+-- except for a sampled hit counter.
+-- ----------------------------------------------------------------------------
+CREATE OR REPLACE FUNCTION rpc_fetch_poi_candidates_cached(
+  p_destination text,
+  p_themes text[],
+  p_quota_attraction int,
+  p_quota_meal int,
+  p_quota_accommodation int,
+
+  p_roles text[] DEFAULT ARRAY['attraction','meal','accommodation'],
+  p_min_rating numeric DEFAULT 2.0,
+  p_min_reviews int DEFAULT 10,
+  p_per_area_cap int DEFAULT 150,
+  p_halal_only boolean DEFAULT false,
+  p_vegetarian_only boolean DEFAULT false,
+  p_vegan_only boolean DEFAULT false,
+  p_wheelchair_only boolean DEFAULT false,
+  p_kids_friendly_only boolean DEFAULT false,
+  p_pets_friendly_only boolean DEFAULT false,
+  p_include_images boolean DEFAULT true,
+  p_excluded_themes text[] DEFAULT NULL,
+  p_seed_lon numeric DEFAULT NULL,
+  p_seed_lat numeric DEFAULT NULL,
+  p_radius_m double precision DEFAULT NULL,
+  p_proximity_weight double precision DEFAULT 0.5
+)
+RETURNS TABLE (
+  id uuid,
+  name text,
+  categories text[],
+  themes theme_key[],
+  roles poi_role[],
+  open_hours jsonb,
+  review_count int,
+  review_rating numeric,
+  latitude double precision,
+  longitude double precision,
+  images text[],
+
+  kids_friendly boolean,
+  pets_friendly boolean,
+  wheelchair_accessible_entrance boolean,
+  wheelchair_accessible_seating boolean,
+  wheelchair_accessible_toilet boolean,
+  halal_food boolean,
+  vegan_options boolean,
+  vegetarian_options boolean,
+
+  role_pick text,
+  area_name text,
+  distance_m double precision
+)
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+#variable_conflict use_column
+DECLARE
+  c_ttl CONSTANT interval := interval '1 hour';
+  c_max_entries CONSTANT int := 5000;
+  -- One hit in c_hit_sample is written, counting for c_hit_sample
+  c_hit_sample CONSTANT int := 16;
+  -- One store in c_evict_sample checks the cap
+  c_evict_sample CONSTANT int := 32;
+  v_params jsonb;
+  v_key text;
+  v_version bigint;
+  v_entries jsonb;
+  v_overflow bigint;
+BEGIN
+  -- Arrays are always stored as (possibly empty) JSON arrays; an empty array
+  -- means the same as NULL to rpc_fetch_poi_candidates_quota
+  v_params := jsonb_build_object(
+    'destination', lower(trim(p_destination)),
+    'themes', COALESCE((SELECT array_agg(DISTINCT t ORDER BY t) FROM unnest(p_themes) AS t), ARRAY[]::text[]),
+    'quota_attraction', p_quota_attraction,
+    'quota_meal', p_quota_meal,
+    'quota_accommodation', p_quota_accommodation,
+    'roles', COALESCE((SELECT array_agg(DISTINCT r ORDER BY r) FROM unnest(p_roles) AS r), ARRAY[]::text[]),
+    'min_rating', p_min_rating,
+    'min_reviews', p_min_reviews,
+    'per_area_cap', p_per_area_cap,
+    'halal_only', p_halal_only,
+    'vegetarian_only', p_vegetarian_only,
+    'vegan_only', p_vegan_only,
+    'wheelchair_only', p_wheelchair_only,
+    'kids_friendly_only', p_kids_friendly_only,
+    'pets_friendly_only', p_pets_friendly_only,
+    'include_images', p_include_images,
+    'excluded_themes', COALESCE((SELECT array_agg(DISTINCT t ORDER BY t) FROM unnest(p_excluded_themes) AS t), ARRAY[]::text[]),
+    'seed_lon', p_seed_lon,
+    'seed_lat', p_seed_lat,
+    'radius_m', p_radius_m,
+    'proximity_weight', p_proximity_weight
+  );
+  v_key := md5(v_params::text);
+  SELECT sum(version)::bigint INTO v_version FROM poi_data_version;
+
+  SELECT c.entries INTO v_entries
+  FROM poi_candidate_cache c
+  WHERE c.cache_key = v_key
+    AND c.data_version = v_version
+    AND c.expires_at > now();
+
+  -- Sampled, and skipped when another session holds the row, so popular
+  -- keys are not serialized on their row lock
+  IF v_entries IS NOT NULL AND random() * c_hit_sample < 1 THEN
+    UPDATE poi_candidate_cache c
+    SET hits = c.hits + c_hit_sample, last_hit_at = now()
+    WHERE c.cache_key = (
+      SELECT l.cache_key FROM poi_candidate_cache l
+      WHERE l.cache_key = v_key
+      FOR UPDATE SKIP LOCKED
+    );
+  END IF;
+
+  IF v_entries IS NULL THEN
+    SELECT COALESCE(jsonb_agg(jsonb_build_object(
+             'id', r.id, 'role_pick', r.role_pick,
+             'area_name', r.area_name, 'distance_m', r.distance_m
+           )), '[]'::jsonb)
+    INTO v_entries
+    FROM rpc_fetch_poi_candidates_quota(
+      p_destination => v_params->>'destination',
+      p_themes => ARRAY(SELECT jsonb_array_elements_text(v_params->'themes')),
+      p_quota_attraction => p_quota_attraction,
+      p_quota_meal => p_quota_meal,
+      p_quota_accommodation => p_quota_accommodation,
+      p_roles => ARRAY(SELECT jsonb_array_elements_text(v_params->'roles')),
+      p_min_rating => p_min_rating,
+      p_min_reviews => p_min_reviews,
+      p_per_area_cap => p_per_area_cap,
+      p_halal_only => p_halal_only,
+      p_vegetarian_only => p_vegetarian_only,
+      p_vegan_only => p_vegan_only,
+      p_wheelchair_only => p_wheelchair_only,
+      p_kids_friendly_only => p_kids_friendly_only,
+      p_pets_friendly_only => p_pets_friendly_only,
+      p_include_images => p_include_images,
+      p_excluded_themes => ARRAY(SELECT jsonb_array_elements_text(v_params->'excluded_themes')),
+      p_seed_lon => p_seed_lon,
+      p_seed_lat => p_seed_lat,
+      p_radius_m => p_radius_m,
+      p_proximity_weight => p_proximity_weight
+    ) AS r;
+
+    -- Anonymous misses are answered but not stored, so unauthenticated
+    -- callers cannot fill the cache with arbitrary parameter sets
+    IF auth.role() IS DISTINCT FROM 'anon' THEN
+      INSERT INTO poi_candidate_cache (cache_key, params, data_version, entries, expires_at)
+      VALUES (v_key, v_params, v_version, v_entries, now() + c_ttl)
+      ON CONFLICT (cache_key) DO UPDATE
+      SET params = EXCLUDED.params,
+          data_version = EXCLUDED.data_version,
+          entries = EXCLUDED.entries,
+          created_at = now(),
+          expires_at = EXCLUDED.expires_at;
+
+      -- Evict beyond the cap on a sample of stores, so the table may overrun
+      -- it briefly: unusable (expired or stale) entries first, then the oldest
+      IF random() * c_evict_sample < 1 THEN
+        SELECT count(*) - c_max_entries INTO v_overflow FROM poi_candidate_cache;
+        IF v_overflow > 0 THEN
+          DELETE FROM poi_candidate_cache c
+          WHERE c.cache_key IN (
+            SELECT o.cache_key
+            FROM poi_candidate_cache o
+            WHERE o.cache_key <> v_key
+            ORDER BY (o.data_version = v_version AND o.expires_at > now()), o.created_at
+            LIMIT v_overflow
+          );
+        END IF;
+      END IF;
+    END IF;
+  END IF;
+
+  RETURN QUERY
+  SELECT
+    p.id,
+    p.name,
+    p.categories,
+    CASE WHEN 'attraction' = ANY(p.poi_roles) THEN p.themes ELSE ARRAY[]::theme_key[] END,
+    p.poi_roles,
+    p.open_hours,
+    p.review_count,
+    p.review_rating::numeric,
+    p.latitude,
+    p.longitude,
+    CASE WHEN p_include_images THEN COALESCE(ARRAY[p.images[1]], ARRAY[]::text[]) ELSE ARRAY[]::text[] END,
+    p.kids_friendly,
+    p.pets_friendly,
+    p.wheelchair_accessible_entrance,
+    p.wheelchair_accessible_seating,
+    p.wheelchair_accessible_toilet,
+    p.halal_food,
+    p.vegan_options,
+    p.vegetarian_options,
+    e.role_pick,
+    e.area_name,
+    e.distance_m
+  FROM jsonb_to_recordset(v_entries) WITH ORDINALITY
+       AS e(id uuid, role_pick text, area_name text, distance_m double precision, ord bigint)
+  JOIN pois p ON p.id = e.id
+  ORDER BY e.ord;
+END;
+$$;
+
+-- ----------------------------------------------------------------------------
+-- Function: refresh_poi_candidate_cache
+-- ----------------------------------------------------------------------------
+-- Pre-warm after a load: re-runs the p_limit most-hit parameter sets whose
+-- entries are stale and keeps them for p_ttl_seconds, then drops expired
+-- entries nobody is refreshing. Returns the number of entries rebuilt.
+-- ----------------------------------------------------------------------------
+CREATE OR REPLACE FUNCTION refresh_poi_candidate_cache(
+  p_limit int DEFAULT 50,
+  p_ttl_seconds int DEFAULT 86400
+)
+RETURNS int
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+  v_version bigint;
+  v_params jsonb;
+  v_count int := 0;
+BEGIN
+  SELECT sum(version)::bigint INTO v_version FROM poi_data_version;
+
+  FOR v_params IN
+    SELECT c.params
+    FROM poi_candidate_cache c
+    WHERE c.data_version <> v_version OR c.expires_at <= now()
+    ORDER BY c.hits DESC
+    LIMIT p_limit
+  LOOP
+    PERFORM 1 FROM rpc_fetch_poi_candidates_cached(
+      p_destination => v_params->>'destination',
+      p_themes => ARRAY(SELECT jsonb_array_elements_text(v_params->'themes')),
+      p_quota_attraction => (v_params->>'quota_attraction')::int,
+      p_quota_meal => (v_params->>'quota_meal')::int,
+      p_quota_accommodation => (v_params->>'quota_accommodation')::int,
+      p_roles => ARRAY(SELECT jsonb_array_elements_text(v_params->'roles')),
+      p_min_rating => (v_params->>'min_rating')::numeric,
+      p_min_reviews => (v_params->>'min_reviews')::int,
+      p_per_area_cap => (v_params->>'per_area_cap')::int,
+      p_halal_only => (v_params->>'halal_only')::boolean,
+      p_vegetarian_only => (v_params->>'vegetarian_only')::boolean,
+      p_vegan_only => (v_params->>'vegan_only')::boolean,
+      p_wheelchair_only => (v_params->>'wheelchair_only')::boolean,
+      p_kids_friendly_only => (v_params->>'kids_friendly_only')::boolean,
+      p_pets_friendly_only => (v_params->>'pets_friendly_only')::boolean,
+      p_include_images => (v_params->>'include_images')::boolean,
+      p_excluded_themes => ARRAY(SELECT jsonb_array_elements_text(v_params->'excluded_themes')),
+      p_seed_lon => (v_params->>'seed_lon')::numeric,
+      p_seed_lat => (v_params->>'seed_lat')::numeric,
+      p_radius_m => (v_params->>'radius_m')::double precision,
+      p_proximity_weight => (v_params->>'proximity_weight')::double precision
+    );
+    UPDATE poi_candidate_cache
+    SET expires_at = now() + make_interval(secs => COALESCE(p_ttl_seconds, 86400))
+    WHERE cache_key = md5(v_params::text);
+    v_count := v_count + 1;
+  END LOOP;
+
+  DELETE FROM poi_candidate_cache WHERE expires_at <= now();
+  RETURN v_count;
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION rpc_fetch_poi_candidates_cached TO authenticated, anon;
+REVOKE EXECUTE ON FUNCTION refresh_poi_candidate_cache FROM PUBLIC, anon, authenticated;
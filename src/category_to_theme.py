@@ -1,15 +1,19 @@
 import os
 import json
+import time
+import random
 import yaml
 from pathlib import Path
 
 from tqdm import tqdm
 from dotenv import load_dotenv
 import google.generativeai as genai
+from google.api_core import exceptions as api_exceptions
 
 # --- Environment / Gemini setup ---
 
 ERROR_LOG = Path("text/classify_errors.log")
+RETRY_QUEUE = Path("text/_retry_queue.jsonl")
 
 # Load .env and read API key
 load_dotenv()
@@ -30,6 +34,27 @@ INPUT_FILE = "text/categories.txt"
 OUTPUT_DIR = Path("text")
 BATCH_SIZE = 10
 MAX_RETRIES = 3
+# Rate limits, server errors and timeouts: the same batch is retried with
+# backoff instead of being split
+API_MAX_RETRIES = 5
+API_BACKOFF = 2.0  # seconds, doubled per attempt
+TRANSIENT_API_ERRORS = (
+    api_exceptions.TooManyRequests,
+    api_exceptions.ResourceExhausted,
+    api_exceptions.ServerError,
+    api_exceptions.DeadlineExceeded,
+    ConnectionError,
+    TimeoutError,
+)
+
+
+class GeminiAPIError(RuntimeError):
+    """The generate_content call itself failed, as opposed to its response."""
+
+    def __init__(self, message: str, transient: bool):
+        super().__init__(message)
+        self.transient = transient
+
 
 # Output buckets (fixed)
 ATTRACTIONS = [
@@ -46,6 +71,95 @@ ATTRACTIONS = [
 ]
 ALL_CATEGORY_KEYS = ["meal", "accommodation"] + [f"attractions/{k}" for k in ATTRACTIONS]
 
+PLANNER_DIR = OUTPUT_DIR / "planner"
+
+# Default planner policy, written to planner/policy.yaml only when that file
+# does not exist. The file is the source of truth: edit it and run with
+# --planner-only to rebuild theme lists without the LLM step.
+PLANNER_POLICY = {
+    "defaults": {
+        "include_buckets": [
+            "meal",
+            "accommodation",
+            "attractions/food_culinary",
+            "attractions/adventure",
+            "attractions/art_museums",
+            "attractions/family",
+            "attractions/cultural_history",
+            "attractions/nature",
+            "attractions/nightlife",
+            "attractions/relax",
+            "attractions/religious_sites",
+            "attractions/shopping",
+        ],
+        "exclude_groups": ["unique", "exclude"],
+        "block_terms": [
+            r"\bwholesale\b",
+            r"\bindustrial\b",
+            r"\brepair\b",
+            r"\bservice\s*center\b",
+            r"\bservicing\b",
+            r"\bworkshop\b",
+        ],
+    },
+    "themes": {
+        "shopping": {
+            "include_only_buckets": ["attractions/shopping"],
+            "extra_block_terms": [
+                r"\bsupply\b",
+                r"\bsupplies\b",
+                r"\bspare\b",
+                r"\bauto\s*part(s)?\b",
+                r"\bhardware\b",
+                r"\belectronic(s)?\s*(shop|store)\b",
+                r"\bpharmacy\b",
+                r"\bconvenience\s*store\b",
+                r"\bsupermarket\b",
+                r"\bwet\s*market\b",
+                r"\bhypermarket\b",
+
+                r"\bgeneral\s+store\b",
+                r"\bwedding\b",
+                r"\bdepartment\s+store\b",
+                r"\bstate\s+liquor\b",
+                r"\bbaby\b",
+                r"\bchildren\b",
+                r"\byouth\s+clothing\b",
+                r"\bsport(ing)?\s+goods\b",
+                r"\bsportswear\b",
+                r"\btextile\s+merchant\b",
+            ],
+        },
+        "food_tour": {
+            "include_only_buckets": ["meal", "attractions/food_culinary"],
+        },
+        "culture": {
+            "include_only_buckets": [
+                "attractions/cultural_history",
+                "attractions/religious_sites",
+            ],
+        },
+        "nature": {
+            "include_only_buckets": ["attractions/nature"],
+        },
+        "adventure": {
+            "include_only_buckets": ["attractions/adventure"],
+        },
+        "nightlife": {
+            "include_only_buckets": ["attractions/nightlife"],
+        },
+        "relax": {
+            "include_only_buckets": ["attractions/relax"],
+        },
+        "family": {
+            "include_only_buckets": ["attractions/family"],
+        },
+        "stay": {
+            "include_only_buckets": ["accommodation"],
+        },
+    },
+}
+
 
 def norm(s: str) -> str:
     import re
@@ -79,7 +193,61 @@ def append_checkpoint(path: Path, batch_map: dict[str, list[str]]):
         for k, v in batch_map.items():
             f.write(json.dumps({"label": k, "buckets": v}, ensure_ascii=False) + "\n")
 
+def load_retry_queue(path: Path) -> dict[str, dict]:
+    """Labels that failed on a previous run, keyed by label."""
+    queue = {}
+    if path.exists():
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    j = json.loads(line)
+                    queue[j["label"]] = j
+                except Exception:
+                    pass
+    return queue
+
+
+def write_retry_queue(path: Path, failed: dict[str, dict]):
+    if not failed:
+        path.unlink(missing_ok=True)
+        return
+    with open(path, "w", encoding="utf-8") as f:
+        for entry in failed.values():
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+def log_error(msg: str):
+    with open(ERROR_LOG, "a", encoding="utf-8") as logf:
+        logf.write(msg + "\n")
+
+
+def salvage_results(text: str) -> list:
+    """Collect every complete {"label": ..., "buckets": [...]} object, even from truncated JSON."""
+    import re
+
+    decoder = json.JSONDecoder()
+    items = []
+    pos = 0
+    for m in re.finditer(r'\{\s*"label"', text):
+        if m.start() < pos:
+            continue
+        try:
+            item, end = decoder.raw_decode(text, m.start())
+        except json.JSONDecodeError:
+            continue
+        items.append(item)
+        pos = end
+    return items
+
+
 def llm_assign_batch(labels: list[str]) -> dict[str, list[str]]:
+    """
+    Classify a batch of labels with Gemini.
+
+    Returns buckets only for labels the model answered with a well-formed
+    item; labels missing from a partial or truncated response are left out
+    so the caller can re-queue them.
+    """
     bucket_guide = {
         "meal": "Restaurants, cafes, pubs/bars serving full meals (breakfast/lunch/dinner).",
         "accommodation": "Hotels, hostels, homestays, resorts, inns, lodges, guest houses.",
@@ -151,7 +319,7 @@ Return ONLY valid JSON in this exact format (no markdown, no explanations):
             },
         )
     except Exception as e:
-        raise RuntimeError(f"Gemini API call failed: {e}") from e
+        raise GeminiAPIError(f"Gemini API call failed: {e}", isinstance(e, TRANSIENT_API_ERRORS)) from e
 
     # 2) Extract raw text safely from candidates
     if not getattr(response, "candidates", None):
@@ -181,46 +349,220 @@ Return ONLY valid JSON in this exact format (no markdown, no explanations):
     elif "```" in cleaned:
         cleaned = cleaned.split("```", 1)[1].split("```", 1)[0].strip()
 
-    # 4) Extract JSON object between first '{' and last '}'
+    # 4) Parse the JSON object between first '{' and last '}'; fall back to
+    #    salvaging individual result items when it is malformed or truncated.
+    results = None
     start = cleaned.find("{")
     end = cleaned.rfind("}")
-    if start == -1 or end == -1 or end < start:
-        raise RuntimeError(f"Could not find JSON object in response: {cleaned[:200]!r}")
-
-    json_str = cleaned[start : end + 1]
-
-    # 5) Parse JSON
-    try:
-        parsed = json.loads(json_str)
-    except json.JSONDecodeError as e:
-        raise RuntimeError(f"JSON parse error: {e}; snippet={json_str[:200]!r}") from e
-
-    results = parsed.get("results")
-    if not isinstance(results, list):
-        raise RuntimeError(f"Unexpected JSON structure, 'results' missing or not a list: {parsed!r}")
-
-    # 6) Normalise buckets
+    if start != -1 and end > start:
+        try:
+            parsed = json.loads(cleaned[start : end + 1])
+            if isinstance(parsed, dict) and isinstance(parsed.get("results"), list):
+                results = parsed["results"]
+        except json.JSONDecodeError:
+            pass
+    if results is None:
+        results = salvage_results(cleaned)
+    if not results:
+        raise RuntimeError(f"No usable results in response: {cleaned[:200]!r}")
+
+    # 5) Normalise buckets, keeping only labels that belong to this batch
     allowed = set(ALL_CATEGORY_KEYS + ["unique", "exclude"])
+    by_norm = {norm(lab): lab for lab in labels}
     out: dict[str, list[str]] = {}
 
     for item in results:
         if not isinstance(item, dict):
             continue
-        lab = item.get("label", "")
+        lab = by_norm.get(norm(str(item.get("label", ""))))
         if not lab:
             continue
         buckets_raw = item.get("buckets", [])
         if not isinstance(buckets_raw, list):
-            buckets_raw = []
-        buckets = [b for b in buckets_raw if b in allowed]
-        out[lab] = buckets
-
-    # 7) Ensure all labels in batch have an entry (possibly empty)
-    for lab in labels:
-        out.setdefault(lab, [])
+            continue
+        out[lab] = [b for b in buckets_raw if b in allowed]
 
     return out
 
+
+def assign_batch_with_backoff(labels: list[str]) -> dict[str, list[str]]:
+    """llm_assign_batch, retrying transient API errors with exponential backoff and jitter."""
+    for attempt in range(1, API_MAX_RETRIES + 1):
+        try:
+            return llm_assign_batch(labels)
+        except GeminiAPIError as e:
+            if not e.transient or attempt == API_MAX_RETRIES:
+                raise
+            delay = API_BACKOFF * 2 ** (attempt - 1) * (1 + random.random() / 2)
+            log_error(f"Transient API error on batch starting '{labels[0]}', retrying in {delay:.1f}s: {e}")
+            time.sleep(delay)
+
+
+def classify_labels(labels: list[str], on_result, failed: dict[str, dict], depth: int = 0):
+    """
+    Classify labels, keeping partial results and bisecting batches that fail.
+
+    Every parsed label is passed to ``on_result`` as soon as it arrives. Labels
+    the model skipped are re-queued; a response that yields nothing splits the
+    batch in half until single labels remain, which get ``MAX_RETRIES`` attempts
+    before being recorded in ``failed``. API errors are retried on the same
+    batch with backoff and never split it; if they persist, the whole batch is
+    recorded in ``failed``.
+    """
+    pending = list(labels)
+    attempts = 0
+    while pending:
+        try:
+            res = assign_batch_with_backoff(pending)
+            error = "model returned no result for label"
+        except GeminiAPIError as e:
+            log_error(f"[ERROR] API error on batch of {len(pending)} starting '{pending[0]}': {e}; queued for next run")
+            for lab in pending:
+                prev = failed.get(lab, {})
+                failed[lab] = {"label": lab, "error": str(e), "attempts": prev.get("attempts", 0) + 1}
+            return
+        except Exception as e:
+            res = {}
+            error = str(e)
+            log_error(f"{'  ' * depth}Batch of {len(pending)} starting '{pending[0]}' failed: {e}")
+
+        if res:
+            on_result(res)
+            pending = [lab for lab in pending if lab not in res]
+            attempts = 0
+            continue
+
+        if len(pending) > 1:
+            mid = len(pending) // 2
+            classify_labels(pending[:mid], on_result, failed, depth + 1)
+            classify_labels(pending[mid:], on_result, failed, depth + 1)
+            return
+
+        attempts += 1
+        if attempts >= MAX_RETRIES:
+            lab = pending[0]
+            prev = failed.get(lab, {})
+            failed[lab] = {
+                "label": lab,
+                "error": error,
+                "attempts": prev.get("attempts", 0) + attempts,
+            }
+            log_error(f"[ERROR] Giving up on '{lab}' after {attempts} attempts; queued for next run")
+            return
+
+
+def read_list(p: Path) -> list[str]:
+    if not p.exists():
+        return []
+    return [ln.strip() for ln in open(p, encoding="utf-8") if ln.strip()]
+
+
+def compile_block_terms(terms: list[str]):
+    """One case-insensitive alternation for a theme's block terms."""
+    import re
+
+    if not terms:
+        return None
+    return re.compile("|".join(f"(?:{t})" for t in terms), flags=re.I)
+
+
+def build_planner(bucket_to_items: dict[str, list[str]], policy: dict) -> dict[str, list[str]]:
+    """
+    Write the per-theme planner lists from the bucket index and a policy.
+
+    Candidates come from a bucket -> labels index, so each theme only visits
+    labels in its allowed buckets. Block terms are compiled once per distinct
+    term set and matched once per label; whitelist, blacklist, unique and
+    exclude lists are applied as set operations.
+    """
+    PLANNER_DIR.mkdir(parents=True, exist_ok=True)
+
+    bucket_to_labels = {b: set(items) for b, items in bucket_to_items.items()}
+    all_labels = set().union(*bucket_to_labels.values())
+    label_text = {lab: lab.lower().replace("_", " ") for lab in all_labels}
+
+    exclude_final_items = set(read_list(OUTPUT_DIR / "exclude_final.txt"))
+    unique_items = set(read_list(OUTPUT_DIR / "unique.txt"))
+
+    WHITELIST_PATH = PLANNER_DIR / "whitelist.txt"
+    BLACKLIST_PATH = PLANNER_DIR / "blacklist.txt"
+    for pth in [WHITELIST_PATH, BLACKLIST_PATH]:
+        if not pth.exists():
+            with open(pth, "w", encoding="utf-8") as f:
+                f.write("")
+
+    whitelist = set(read_list(WHITELIST_PATH))
+    blacklist = set(read_list(BLACKLIST_PATH))
+
+    # Dropped from every theme regardless of buckets
+    dropped = blacklist | exclude_final_items | (unique_items - whitelist)
+
+    # Themes without extra terms share the defaults, so cache per term set
+    blocked_cache: dict[tuple, set[str]] = {}
+
+    def blocked_labels(terms: list[str]) -> set[str]:
+        key = tuple(terms)
+        if key not in blocked_cache:
+            pattern = compile_block_terms(terms)
+            blocked_cache[key] = (
+                {lab for lab, t in label_text.items() if pattern.search(t)}
+                if pattern
+                else set()
+            )
+        return blocked_cache[key]
+
+    defaults = policy["defaults"]
+    planner_index = {}
+    for theme, cfg in policy["themes"].items():
+        include_only = cfg.get("include_only_buckets")
+        allowed_buckets = set(include_only) if include_only else set(
+            defaults["include_buckets"]
+        )
+        allowed_buckets |= set(cfg.get("also_allow_buckets", []))
+
+        block_terms = list(defaults["block_terms"]) + list(cfg.get("extra_block_terms", []))
+
+        labels = set().union(*(bucket_to_labels.get(b, set()) for b in allowed_buckets))
+        labels -= dropped
+        labels -= blocked_labels(block_terms) - whitelist
+
+        lst = sorted(labels, key=str.lower)
+        with open(PLANNER_DIR / f"{theme}.txt", "w", encoding="utf-8") as f:
+            f.write("\n".join(lst))
+        with open(PLANNER_DIR / f"{theme}.json", "w", encoding="utf-8") as f:
+            json.dump({"theme": theme, "items": lst}, f, ensure_ascii=False, indent=2)
+        planner_index[theme] = lst
+
+    compact = {
+        theme: [{"label": it, "slug": slugify(it)} for it in items]
+        for theme, items in planner_index.items()
+    }
+    with open(PLANNER_DIR / "planner_index.json", "w", encoding="utf-8") as f:
+        json.dump(compact, f, ensure_ascii=False, indent=2)
+
+    return planner_index
+
+
+def load_planner_policy() -> dict:
+    """planner/policy.yaml, first written from PLANNER_POLICY if it is missing."""
+    path = PLANNER_DIR / "policy.yaml"
+    if not path.exists():
+        PLANNER_DIR.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            yaml.safe_dump(PLANNER_POLICY, f, sort_keys=False, allow_unicode=True)
+        print(f"Wrote default planner policy: {path}")
+    with open(path, "r", encoding="utf-8") as f:
+        return yaml.safe_load(f)
+
+
+def rebuild_planner():
+    """Re-run only the planner layer from bucket_index.json and an edited policy.yaml."""
+    with open(OUTPUT_DIR / "bucket_index.json", "r", encoding="utf-8") as f:
+        bucket_to_items = json.load(f)
+    build_planner(bucket_to_items, load_planner_policy())
+    print(f"Planner rebuilt: {PLANNER_DIR.resolve()}")
+
+
 def main():
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
     (OUTPUT_DIR / "attractions").mkdir(parents=True, exist_ok=True)
@@ -244,40 +586,38 @@ def main():
                 ai_unique.add(lab)
 
     already = set(prev)
-    remaining = [x for x in raw if x not in already]
+    queued = load_retry_queue(RETRY_QUEUE)
+    # Labels that failed last run go first
+    ordered = list(dict.fromkeys([*queued, *raw]))
+    remaining = [x for x in ordered if x not in already]
+
+    # Labels that failed last run stay queued until they get a result
+    failed = {lab: entry for lab, entry in queued.items() if lab not in already}
+
+    def record(res: dict[str, list[str]]):
+        for label, buckets in res.items():
+            failed.pop(label, None)
+            for b in buckets:
+                if b in assigned:
+                    assigned[b].append(label)
+                elif b == "exclude":
+                    ai_exclude.add(label)
+                elif b == "unique":
+                    ai_unique.add(label)
+        append_checkpoint(ckpt_path, res)
 
     if remaining:
         print(f"Classifying {len(remaining)} labels with {MODEL_NAME}...")
+        if failed:
+            print(f"  {len(failed)} from retry queue first")
         for i in tqdm(
             range(0, len(remaining), BATCH_SIZE), desc="Classifying", ncols=80
         ):
-            batch = remaining[i : i + BATCH_SIZE]
-            for attempt in range(1, MAX_RETRIES + 1):
-                try:
-                    res = llm_assign_batch(batch)
-
-                    for label, buckets in res.items():
-                        if not buckets:
-                            continue
-                        for b in buckets:
-                            if b in assigned:
-                                assigned[b].append(label)
-                            elif b == "exclude":
-                                ai_exclude.add(label)
-                            elif b == "unique":
-                                ai_unique.add(label)
-
-                    append_checkpoint(ckpt_path, res)
-                    break
-                except Exception as e:
-                    with open(ERROR_LOG, "a", encoding="utf-8") as logf:
-                        logf.write(f"Attempt {attempt}/{MAX_RETRIES} failed for batch starting '{batch[0]}': {e}\n")
-                    if attempt == MAX_RETRIES:
-                        with open(ERROR_LOG, "a", encoding="utf-8") as logf:
-                            logf.write(f"[ERROR] Giving up on batch starting '{batch[0]}'\n")
-                    # optional: small backoff
-                    # import time; time.sleep(0.5)
-                    continue
+            classify_labels(remaining[i : i + BATCH_SIZE], record, failed)
+
+    write_retry_queue(RETRY_QUEUE, failed)
+    if failed:
+        print(f"⚠️  {len(failed)} labels still failing; see {RETRY_QUEUE}")
 
     # Finalize
     matched_any = (
@@ -325,173 +665,16 @@ def main():
     with open(OUTPUT_DIR / "label_index.json", "w", encoding="utf-8") as f:
         json.dump(label_to_buckets, f, ensure_ascii=False, indent=2)
 
-    # Planner layer
-    PLANNER_DIR = OUTPUT_DIR / "planner"
-    PLANNER_DIR.mkdir(parents=True, exist_ok=True)
-
-    PLANNER_POLICY = {
-        "defaults": {
-            "include_buckets": [
-                "meal",
-                "accommodation",
-                "attractions/food_culinary",
-                "attractions/adventure",
-                "attractions/art_museums",
-                "attractions/family",
-                "attractions/cultural_history",
-                "attractions/nature",
-                "attractions/nightlife",
-                "attractions/relax",
-                "attractions/religious_sites",
-                "attractions/shopping",
-            ],
-            "exclude_groups": ["unique", "exclude"],
-            "block_terms": [
-                r"\bwholesale\b",
-                r"\bindustrial\b",
-                r"\brepair\b",
-                r"\bservice\s*center\b",
-                r"\bservicing\b",
-                r"\bworkshop\b",
-            ],
-        },
-        "themes": {
-            "shopping": {
-                "include_only_buckets": ["attractions/shopping"],
-                "extra_block_terms": [
-                    r"\bsupply\b",
-                    r"\bsupplies\b",
-                    r"\bspare\b",
-                    r"\bauto\s*part(s)?\b",
-                    r"\bhardware\b",
-                    r"\belectronic(s)?\s*(shop|store)\b",
-                    r"\bpharmacy\b",
-                    r"\bconvenience\s*store\b",
-                    r"\bsupermarket\b",
-                    r"\bwet\s*market\b",
-                    r"\bhypermarket\b",
-
-                    r"\bgeneral\s+store\b",
-                    r"\bwedding\b",
-                    r"\bdepartment\s+store\b",
-                    r"\bstate\s+liquor\b",
-                    r"\bbaby\b",
-                    r"\bchildren\b",
-                    r"\byouth\s+clothing\b",
-                    r"\bsport(ing)?\s+goods\b",
-                    r"\bsportswear\b",
-                    r"\btextile\s+merchant\b",
-                ],
-            },
-            "food_tour": {
-                "include_only_buckets": ["meal", "attractions/food_culinary"],
-            },
-            "culture": {
-                "include_only_buckets": [
-                    "attractions/cultural_history",
-                    "attractions/religious_sites",
-                ],
-            },
-            "nature": {
-                "include_only_buckets": ["attractions/nature"],
-            },
-            "adventure": {
-                "include_only_buckets": ["attractions/adventure"],
-            },
-            "nightlife": {
-                "include_only_buckets": ["attractions/nightlife"],
-            },
-            "relax": {
-                "include_only_buckets": ["attractions/relax"],
-            },
-            "family": {
-                "include_only_buckets": ["attractions/family"],
-            },
-            "stay": {
-                "include_only_buckets": ["accommodation"],
-            },
-        },
-    }
-
-    with open(PLANNER_DIR / "policy.yaml", "w", encoding="utf-8") as f:
-        yaml.safe_dump(PLANNER_POLICY, f, sort_keys=False, allow_unicode=True)
-
-    def read_list(p):
-        if not p.exists():
-            return []
-        return [ln.strip() for ln in open(p, encoding="utf-8") if ln.strip()]
-
-    exclude_final_items = set(read_list(OUTPUT_DIR / "exclude_final.txt"))
-    unique_items = set(read_list(OUTPUT_DIR / "unique.txt"))
-
-    WHITELIST_PATH = PLANNER_DIR / "whitelist.txt"
-    BLACKLIST_PATH = PLANNER_DIR / "blacklist.txt"
-    for pth in [WHITELIST_PATH, BLACKLIST_PATH]:
-        if not pth.exists():
-            with open(pth, "w", encoding="utf-8") as f:
-                f.write("")
-
-    whitelist = set(read_list(WHITELIST_PATH))
-    blacklist = set(read_list(BLACKLIST_PATH))
-
-    def any_matches(text, patterns):
-        import re
-
-        t = text.lower().replace("_", " ")
-        for pat in patterns:
-            if re.search(pat, t, flags=re.I):
-                return True
-        return False
-
-
-    def build_theme_list(theme: str, policy: dict) -> list[str]:
-        defaults = policy["defaults"]
-        cfg = policy["themes"][theme]
-        include_only = cfg.get("include_only_buckets")
-        also_allow = cfg.get("also_allow_buckets", [])
-        extra_blocks = cfg.get("extra_block_terms", [])
-
-        allowed_buckets = set(include_only) if include_only else set(
-            defaults["include_buckets"]
-        )
-        allowed_buckets |= set(also_allow)
-
-        block_terms = list(defaults["block_terms"]) + list(extra_blocks)
-
-        out = []
-        for label, buckets in label_to_buckets.items():
-            if label in blacklist:
-                continue
-            if label in exclude_final_items:
-                continue
-            if label in unique_items and label not in whitelist:
-                continue
-            if not (set(buckets) & allowed_buckets):
-                continue
-            if label not in whitelist and any_matches(label, block_terms):
-                continue
-            out.append(label)
-
-        return sorted(set(out), key=str.lower)
-
-    planner_index = {}
-    for theme in PLANNER_POLICY["themes"].keys():
-        lst = build_theme_list(theme, PLANNER_POLICY)
-        with open(PLANNER_DIR / f"{theme}.txt", "w", encoding="utf-8") as f:
-            f.write("\n".join(lst))
-        with open(PLANNER_DIR / f"{theme}.json", "w", encoding="utf-8") as f:
-            json.dump({"theme": theme, "items": lst}, f, ensure_ascii=False, indent=2)
-        planner_index[theme] = lst
-
-    compact = {
-        theme: [{"label": it, "slug": slugify(it)} for it in items]
-        for theme, items in planner_index.items()
-    }
-    with open(PLANNER_DIR / "planner_index.json", "w", encoding="utf-8") as f:
-        json.dump(compact, f, ensure_ascii=False, indent=2)
+    # Planner layer; keeps any edits made to policy.yaml
+    build_planner(bucket_to_items, load_planner_policy())
 
     print(f"Done. Output: {OUTPUT_DIR.resolve()}")
 
 
 if __name__ == "__main__":
-    main()
+    import sys
+
+    if "--planner-only" in sys.argv[1:]:
+        rebuild_planner()
+    else:
+        main()
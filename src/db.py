@@ -0,0 +1,274 @@
+"""
+Shared database access for the loaders.
+
+One Supabase REST client (keep-alive HTTP connections, shared by threads)
+and one pool of direct Postgres connections, plus the bulk primitives the
+loaders need: chunked upsert, RPC and COPY with retry. Every call is
+recorded in ``metrics``; loaders print ``metrics.report()`` when done.
+"""
+import os
+import time
+import random
+import threading
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# REST
+REST_CHUNK_SIZE = 1000
+REST_TIMEOUT = 120  # seconds per request
+MAX_RETRIES = 4
+RETRY_BACKOFF = 1.0  # seconds, doubled per attempt
+# Error codes worth retrying. Non-JSON responses (gateway errors, rate
+# limits) carry the HTTP status as their code; JSON ones carry PostgREST or
+# SQLSTATE codes: pool/connection errors, serialization failures, deadlocks,
+# statement timeouts, shutdowns, and the connection (08) and resource (53)
+# classes. Anything else (constraint violations, bad payloads) fails at once.
+RETRYABLE_CODES = {"429", "500", "502", "503", "504",
+                   "PGRST000", "PGRST001", "PGRST002", "PGRST003",
+                   "40001", "40P01", "57014", "57P01"}
+RETRYABLE_SQLSTATE_CLASSES = ("08", "53")
+
+# Direct Postgres
+# Session pooler for the project's region; override with SUPABASE_DB_HOST
+# (e.g. db.<ref>.supabase.co for the direct connection) or SUPABASE_DB_URL.
+DEFAULT_DB_HOST = "aws-1-ap-southeast-1.pooler.supabase.com"
+DEFAULT_DB_PORT = 5432
+PG_POOL_MAX = 4
+PG_KEEPALIVES = {"keepalives": 1, "keepalives_idle": 30, "keepalives_interval": 10, "keepalives_count": 5}
+
+
+class Metrics:
+    """Thread-safe call counts, retries, rows and latencies per operation."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.ops = {}
+        self.pg_connections = 0
+        self.pg_checkouts = 0
+        self.pg_wait = 0.0
+
+    def record(self, op: str, seconds: float, rows: int = 0, attempts: int = 1, ok: bool = True):
+        with self._lock:
+            s = self.ops.setdefault(op, {"calls": 0, "retries": 0, "failed": 0, "rows": 0, "latencies": []})
+            s["calls"] += 1
+            s["retries"] += attempts - 1
+            s["failed"] += 0 if ok else 1
+            s["rows"] += rows
+            s["latencies"].append(seconds)
+
+    def connected(self):
+        with self._lock:
+            self.pg_connections += 1
+
+    def checkout(self, wait: float):
+        with self._lock:
+            self.pg_checkouts += 1
+            self.pg_wait += wait
+
+    def report(self):
+        with self._lock:
+            if not self.ops and not self.pg_checkouts:
+                return
+            print("Database calls:")
+            for op, s in sorted(self.ops.items()):
+                lat = sorted(s["latencies"])
+                p50 = lat[len(lat) // 2]
+                p95 = lat[min(len(lat) - 1, int(len(lat) * 0.95))]
+                print(f"  {op:<28} {s['calls']:>6} calls  {s['rows']:>8} rows  "
+                      f"p50 {p50 * 1000:7.0f} ms  p95 {p95 * 1000:7.0f} ms  "
+                      f"retries {s['retries']}  failed {s['failed']}")
+            if self.pg_checkouts:
+                print(f"  postgres: {self.pg_connections} connections opened, "
+                      f"{self.pg_checkouts} checkouts, {self.pg_wait:.2f}s waiting")
+
+
+metrics = Metrics()
+
+_lock = threading.Lock()
+_rest = None
+_pg_pool = None
+# ThreadedConnectionPool raises instead of waiting when every connection is
+# out; checkouts queue here first, so extra workers wait for a free one
+_pg_slots = threading.BoundedSemaphore(PG_POOL_MAX)
+
+
+def get_conn_string() -> str:
+    """
+    Postgres DSN: SUPABASE_DB_URL if set, otherwise built from SUPABASE_URL,
+    SUPABASE_PASSWORD and SUPABASE_DB_HOST / SUPABASE_DB_PORT.
+    """
+    if os.environ.get("SUPABASE_DB_URL"):
+        return os.environ["SUPABASE_DB_URL"]
+
+    supabase_url = os.environ.get("SUPABASE_URL")
+    db_password = os.environ.get("SUPABASE_PASSWORD")
+
+    if not supabase_url:
+        print("❌ Missing SUPABASE_URL in .env")
+        exit(1)
+    if not db_password:
+        print("❌ Missing SUPABASE_PASSWORD in .env")
+        exit(1)
+
+    project_ref = supabase_url.replace("https://", "").replace(".supabase.co", "")
+    host = os.environ.get("SUPABASE_DB_HOST", DEFAULT_DB_HOST)
+    port = os.environ.get("SUPABASE_DB_PORT", DEFAULT_DB_PORT)
+    # The pooler routes on the user name; the direct connection does not
+    user = f"postgres.{project_ref}" if "pooler." in host else "postgres"
+
+    return f"postgresql://{user}:{db_password}@{host}:{port}/postgres"
+
+
+# --- REST ---
+
+def rest():
+    """The process-wide Supabase client; its HTTP connections are kept alive."""
+    global _rest
+    with _lock:
+        if _rest is None:
+            from supabase import create_client, ClientOptions
+            _rest = create_client(
+                os.environ["SUPABASE_URL"],
+                os.environ["SUPABASE_KEY"],
+                options=ClientOptions(postgrest_client_timeout=REST_TIMEOUT),
+            )
+        return _rest
+
+
+def is_transient(exc: Exception) -> bool:
+    """Transport failures and 5xx/429-type errors, which may succeed on retry."""
+    if isinstance(exc, (ConnectionError, TimeoutError)):
+        return True
+    try:
+        import httpx
+        if isinstance(exc, httpx.TransportError):
+            return True
+    except ImportError:
+        pass
+    code = str(getattr(exc, "code", None) or "")
+    return code in RETRYABLE_CODES or code[:2] in RETRYABLE_SQLSTATE_CLASSES
+
+
+def with_retry(op: str, fn, rows: int = 0):
+    """
+    Call ``fn()``, retrying transient errors with exponential backoff and
+    jitter, recording it under ``op``. Returns (result, attempts); re-raises
+    other errors at once and transient ones after MAX_RETRIES.
+    """
+    for attempt in range(1, MAX_RETRIES + 1):
+        started = time.perf_counter()
+        try:
+            result = fn()
+        except Exception as e:
+            if attempt == MAX_RETRIES or not is_transient(e):
+                metrics.record(op, time.perf_counter() - started, 0, attempt, ok=False)
+                raise
+            time.sleep(RETRY_BACKOFF * 2 ** (attempt - 1) * (1 + random.random() / 2))
+            continue
+        metrics.record(op, time.perf_counter() - started, rows, attempt)
+        return result, attempt
+
+
+def upsert(table: str, rows: list[dict], on_conflict: str, chunk_size: int = REST_CHUNK_SIZE) -> int:
+    """Upsert ``rows`` in chunks, each retried. Returns the most attempts any chunk needed."""
+    most = 0
+    for i in range(0, len(rows), chunk_size):
+        chunk = rows[i:i + chunk_size]
+        _, attempts = with_retry(
+            f"upsert {table}",
+            lambda: rest().table(table).upsert(chunk, on_conflict=on_conflict).execute(),
+            rows=len(chunk),
+        )
+        most = max(most, attempts)
+    return most
+
+
+def rpc(name: str, params: dict | None = None):
+    """Call a Postgres function through PostgREST with retry; returns its data."""
+    res, _ = with_retry(f"rpc {name}", lambda: rest().rpc(name, params or {}).execute())
+    return res.data
+
+
+def execute(op: str, query, rows: int = 0):
+    """Execute a prepared PostgREST query builder with retry; returns its data."""
+    res, _ = with_retry(op, query.execute, rows=rows)
+    return res.data
+
+
+# --- Direct Postgres ---
+
+def _pool():
+    global _pg_pool
+    with _lock:
+        if _pg_pool is None:
+            from psycopg2.pool import ThreadedConnectionPool
+
+            class _CountingPool(ThreadedConnectionPool):
+                def _connect(self, key=None):
+                    metrics.connected()
+                    return super()._connect(key)
+
+            _pg_pool = _CountingPool(1, PG_POOL_MAX, get_conn_string(), **PG_KEEPALIVES)
+        return _pg_pool
+
+
+@contextmanager
+def pg_connection():
+    """
+    A pooled direct Postgres connection. Waits while all PG_POOL_MAX are in
+    use. Commits when the block succeeds, rolls back when it raises, and
+    returns the connection to the pool, or discards it if it was lost.
+    """
+    from psycopg2 import InterfaceError, OperationalError
+
+    started = time.perf_counter()
+    _pg_slots.acquire()
+    try:
+        pool = _pool()
+        conn = pool.getconn()
+    except Exception:
+        _pg_slots.release()
+        raise
+    metrics.checkout(time.perf_counter() - started)
+    broken = False
+    try:
+        yield conn
+        conn.commit()
+    except Exception as e:
+        broken = isinstance(e, (OperationalError, InterfaceError))
+        if not conn.closed:
+            try:
+                conn.rollback()
+            except (OperationalError, InterfaceError):
+                broken = True
+        raise
+    finally:
+        pool.putconn(conn, close=broken or bool(conn.closed))
+        _pg_slots.release()
+
+
+def copy_from(cur, table: str, columns, buf, rows: int = 0):
+    """COPY a CSV buffer into ``table`` on an open cursor."""
+    started = time.perf_counter()
+    cur.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buf)
+    metrics.record(f"copy {table}", time.perf_counter() - started, rows)
+
+
+def timed(cur, op: str, sql: str, params=None):
+    """Execute one statement on ``cur``, recorded under ``op``; returns rowcount."""
+    started = time.perf_counter()
+    cur.execute(sql, params)
+    metrics.record(op, time.perf_counter() - started, max(cur.rowcount, 0))
+    return cur.rowcount
+
+
+def close():
+    """Close pooled Postgres connections."""
+    global _pg_pool
+    with _lock:
+        if _pg_pool is not None:
+            _pg_pool.closeall()
+            _pg_pool = None
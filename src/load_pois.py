@@ -1,19 +1,49 @@
+import io
 import os
 import ast
 import json
+import sys
+import time
+import hashlib
+import argparse
 import pandas as pd
-from dotenv import load_dotenv
-from supabase import create_client
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 
-load_dotenv()
-supabase = create_client(os.environ["SUPABASE_URL"], os.environ["SUPABASE_KEY"])
+import db
 
-df = pd.read_csv('output/poi.csv')
+CSV_PATH = 'output/poi.csv'
+BATCH_SIZE = 1000
+
+# Column groups of poi.csv -> pois payload
+TEXT_COLUMNS = ['address', 'timezone', 'website', 'phone', 'descriptions']
+INT_COLUMNS = ['review_count']
+FLOAT_COLUMNS = ['review_rating', 'latitude', 'longitude', 'price_level']
+STRUCT_COLUMNS = ['open_hours', 'images', 'complete_address']
+# 'reviews_per_rating', 'videos', 'about' are not uploaded
+BOOL_COLUMNS = [
+    'kids_friendly',
+    'pets_friendly',
+    'wheelchair_rental',
+    'wheelchair_accessible_car_park',
+    'wheelchair_accessible_entrance',
+    'wheelchair_accessible_seating',
+    'wheelchair_accessible_toilet',
+    'halal_food',
+    'vegan_options',
+    'vegetarian_options',
+    'reservations_required',
+]
 
 def safe_parse(value):
     if pd.isna(value) or value == '{}':
         return None
     if isinstance(value, str):
+        # clean.py writes JSON for most columns; fall back to Python literals
+        try:
+            return json.loads(value)
+        except ValueError:
+            pass
         try:
             return ast.literal_eval(value)
         except:
@@ -40,50 +70,374 @@ def to_list_tokens(v):
         return [s.lower()]
     return [str(v).strip().lower()]
 
-def prepare_row(row):
-    return {
-        'google_map_link': row['link'],
-        'name': row['name'],
-        'categories': to_list_tokens(row.get('categories')),
-        'address': row['address'] if pd.notna(row['address']) else None,
-        'timezone': row['timezone'] if pd.notna(row['timezone']) else None,
-        'open_hours': safe_parse(row['open_hours']),
-        'website': row['website'] if pd.notna(row['website']) else None,
-        'phone': row['phone'] if pd.notna(row['phone']) else None,
-        'review_count': int(row['review_count']) if pd.notna(row['review_count']) else None,
-        'review_rating': float(row['review_rating']) if pd.notna(row['review_rating']) else None,
-        # 'reviews_per_rating': safe_parse(row['reviews_per_rating']),
-        'latitude': float(row['latitude']) if pd.notna(row['latitude']) else None,
-        'longitude': float(row['longitude']) if pd.notna(row['longitude']) else None,
-        'descriptions': row['descriptions'] if pd.notna(row['descriptions']) else None,
-        'price_level': float(row['price_level']) if pd.notna(row['price_level']) else None,
-        'images': safe_parse(row['images']),
-        # 'videos': safe_parse(row['videos']),
-        'complete_address': safe_parse(row['complete_address']),
-        # 'about': safe_parse(row['about']),
-        'kids_friendly': bool(row['kids_friendly']) if pd.notna(row['kids_friendly']) else False,
-        'pets_friendly': bool(row['pets_friendly']) if pd.notna(row['pets_friendly']) else False,
-        'wheelchair_rental': bool(row['wheelchair_rental']) if pd.notna(row['wheelchair_rental']) else False,
-        'wheelchair_accessible_car_park': bool(row['wheelchair_accessible_car_park']) if pd.notna(row['wheelchair_accessible_car_park']) else False,
-        'wheelchair_accessible_entrance': bool(row['wheelchair_accessible_entrance']) if pd.notna(row['wheelchair_accessible_entrance']) else False,
-        'wheelchair_accessible_seating': bool(row['wheelchair_accessible_seating']) if pd.notna(row['wheelchair_accessible_seating']) else False,
-        'wheelchair_accessible_toilet': bool(row['wheelchair_accessible_toilet']) if pd.notna(row['wheelchair_accessible_toilet']) else False,
-        'halal_food': bool(row['halal_food']) if pd.notna(row['halal_food']) else False,
-        'vegan_options': bool(row['vegan_options']) if pd.notna(row['vegan_options']) else False,
-        'vegetarian_options': bool(row['vegetarian_options']) if pd.notna(row['vegetarian_options']) else False,
-        'reservations_required': bool(row['reservations_required']) if pd.notna(row['reservations_required']) else False,
-    }
+def _nullable(s: pd.Series) -> pd.Series:
+    """Object column with NaN/NA replaced by None (JSON null)."""
+    return s.astype(object).where(s.notna(), None)
 
-BATCH_SIZE = 1000
-total_rows = len(df)
-
-for i in range(0, total_rows, BATCH_SIZE):
-    batch = df.iloc[i:i+BATCH_SIZE]
-    data = [prepare_row(row) for _, row in batch.iterrows()]
-    try:
-        supabase.table('pois').upsert(data, on_conflict='google_map_link').execute()
-        print(f"Upserted batch {i//BATCH_SIZE + 1}: {len(data)} rows")
-    except Exception as e:
-        print(f"Error on batch {i//BATCH_SIZE + 1}: {e}")
-
-print(f"✅ Upload complete! Total rows: {total_rows}")
+def row_hash(record: dict) -> str:
+    """Stable digest of a cleaned payload row, used by --delta."""
+    blob = json.dumps(record, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha1(blob.encode('utf-8')).hexdigest()
+
+def prepare_batch(batch: pd.DataFrame) -> pd.DataFrame:
+    """Build the pois payload column-wise for one CSV chunk."""
+    def col(name):
+        if name in batch:
+            return batch[name]
+        return pd.Series(None, index=batch.index, dtype=object)
+
+    out = pd.DataFrame(index=batch.index)
+    out['google_map_link'] = batch['link']
+    out['name'] = batch['name']
+    out['categories'] = col('categories').map(to_list_tokens)
+
+    for c in TEXT_COLUMNS:
+        out[c] = _nullable(col(c))
+    for c in INT_COLUMNS:
+        out[c] = _nullable(pd.to_numeric(col(c), errors='coerce').round().astype('Int64'))
+    for c in FLOAT_COLUMNS:
+        out[c] = _nullable(pd.to_numeric(col(c), errors='coerce'))
+    for c in STRUCT_COLUMNS:
+        out[c] = col(c).map(safe_parse, na_action='ignore').astype(object)
+        out[c] = out[c].where(out[c].notna(), None)
+    for c in BOOL_COLUMNS:
+        out[c] = col(c).fillna(False).astype(bool)
+
+    out['content_hash'] = [row_hash(r) for r in out.to_dict('records')]
+    return out
+
+def _read_chunks(path: str, batch_size: int):
+    return pd.read_csv(path, chunksize=batch_size, dtype={c: str for c in TEXT_COLUMNS})
+
+def iter_frames(path: str = CSV_PATH, batch_size: int = BATCH_SIZE):
+    """Stream prepared payload frames without materializing the whole CSV."""
+    for chunk in _read_chunks(path, batch_size):
+        yield prepare_batch(chunk)
+
+def iter_batches(path: str = CSV_PATH, batch_size: int = BATCH_SIZE, skip=None):
+    """
+    Stream (batch_number, (start_row, end_row), records) for the REST upsert.
+
+    Batches for which ``skip(start_row, end_row)`` is true are not prepared.
+    """
+    start = 0
+    for n, chunk in enumerate(_read_chunks(path, batch_size), start=1):
+        rows = (start, start + len(chunk))
+        start = rows[1]
+        if skip and skip(*rows):
+            continue
+        yield n, rows, prepare_batch(chunk).to_dict('records')
+
+# --- Concurrent REST upload ---
+
+MANIFEST_PATH = 'output/.load_pois_manifest.json'
+WORKERS = 4
+
+def _merge_ranges(ranges):
+    merged = []
+    for lo, hi in sorted(ranges):
+        if merged and lo <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], hi)
+        else:
+            merged.append([lo, hi])
+    return merged
+
+def _csv_fingerprint(path: str, batch_size: int) -> dict:
+    st = os.stat(path)
+    return {"csv": path, "size": st.st_size, "mtime": int(st.st_mtime), "batch_size": batch_size}
+
+def load_manifest(path: str, fingerprint: dict) -> list:
+    """Completed row ranges from a previous run of the same CSV, if any."""
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if any(manifest.get(k) != v for k, v in fingerprint.items()):
+        print("Manifest is for a different poi.csv or batch size; starting over")
+        return []
+    return manifest.get("done", [])
+
+def save_manifest(path: str, fingerprint: dict, done: list):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({**fingerprint, "done": done}, f)
+    os.replace(tmp, path)
+
+# --- Delta upload ---
+
+PRUNE_MODES = ('mark', 'delete')
+PRUNE_CHUNK = 200
+
+def fetch_existing(page_size: int = 1000) -> dict[str, dict]:
+    """id, content_hash and missing_since of every POI, keyed by google_map_link."""
+    existing = {}
+    last_id = None
+    while True:
+        q = db.rest().table('pois').select('id,google_map_link,content_hash,missing_since').order('id').limit(page_size)
+        if last_id:
+            q = q.gt('id', last_id)
+        rows = db.execute('select pois', q)
+        for r in rows:
+            existing[r['google_map_link']] = r
+        if len(rows) < page_size:
+            return existing
+        last_id = rows[-1]['id']
+
+def changed_rows(data: list[dict], existing: dict[str, dict]) -> list[dict]:
+    """New rows, rows whose hash differs, and marked rows that reappeared."""
+    out = []
+    for r in data:
+        cur = existing.get(r['google_map_link'])
+        if cur is None or cur['content_hash'] != r['content_hash'] or cur['missing_since']:
+            out.append({**r, 'missing_since': None})
+    return out
+
+def prune_missing(existing: dict[str, dict], seen: set[str], mode: str) -> int:
+    """Mark (missing_since) or delete POIs that are no longer in poi.csv."""
+    gone = [
+        r['id'] for link, r in existing.items()
+        if link not in seen and not (mode == 'mark' and r['missing_since'])
+    ]
+    now = datetime.now(timezone.utc).isoformat()
+    for i in range(0, len(gone), PRUNE_CHUNK):
+        chunk = gone[i:i+PRUNE_CHUNK]
+        if mode == 'delete':
+            db.execute('delete pois', db.rest().table('pois').delete().in_('id', chunk), rows=len(chunk))
+        else:
+            q = db.rest().table('pois').update({'missing_since': now}).in_('id', chunk)
+            db.execute('mark pois', q, rows=len(chunk))
+    return len(gone)
+
+def upload_rest(workers: int = WORKERS, resume: bool = False, delta: bool = False, prune: str | None = None):
+    """
+    Upsert batches through the REST API with a bounded pool of workers.
+
+    All workers share db.rest(), so requests reuse its keep-alive
+    connections; each batch is retried by db.upsert. Finished row ranges go to MANIFEST_PATH as they
+    complete; with ``resume`` those ranges are skipped. With ``delta`` only
+    rows whose content_hash differs from the table are sent, and ``prune``
+    marks or deletes POIs missing from the CSV afterwards.
+    """
+    existing = fetch_existing() if (delta or prune) else None
+    if existing is not None:
+        print(f"Fetched {len(existing)} existing content hashes")
+    seen = set()
+
+    fingerprint = _csv_fingerprint(CSV_PATH, BATCH_SIZE)
+    done = load_manifest(MANIFEST_PATH, fingerprint) if resume else []
+    if done:
+        print(f"Resuming: {sum(hi - lo for lo, hi in done)} rows already uploaded")
+
+    def is_done(lo, hi):
+        return any(d_lo <= lo and hi <= d_hi for d_lo, d_hi in done)
+
+    uploaded = retried = failed = unchanged = 0
+    pending = {}
+
+    def collect(futures):
+        nonlocal done, uploaded, retried, failed
+        for fut in futures:
+            n, rows, size = pending.pop(fut)
+            try:
+                attempts = fut.result()
+            except Exception as e:
+                failed += size
+                print(f"Error on batch {n} (rows {rows[0]}-{rows[1]}): {e}")
+                continue
+            uploaded += size
+            if attempts > 1:
+                retried += size
+            done = _merge_ranges(done + [list(rows)])
+            save_manifest(MANIFEST_PATH, fingerprint, done)
+            print(f"Upserted batch {n}: {size} rows" + (f" after {attempts} attempts" if attempts > 1 else ""))
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for n, rows, data in iter_batches(CSV_PATH, BATCH_SIZE, skip=is_done):
+            if prune:
+                seen.update(r['google_map_link'] for r in data)
+            if delta:
+                size = len(data)
+                data = changed_rows(data, existing)
+                unchanged += size - len(data)
+                if not data:
+                    done = _merge_ranges(done + [list(rows)])
+                    save_manifest(MANIFEST_PATH, fingerprint, done)
+                    continue
+            else:
+                data = [{**r, 'missing_since': None} for r in data]
+            # Bound in-flight batches so the CSV keeps streaming
+            if len(pending) >= workers * 2:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(finished)
+            pending[pool.submit(db.upsert, 'pois', data, 'google_map_link', BATCH_SIZE)] = (n, rows, len(data))
+        collect(list(pending))
+
+    if prune:
+        print(f"Pruned ({prune}) {prune_missing(existing, seen, prune)} POIs missing from {CSV_PATH}")
+
+    summary = f"Uploaded: {uploaded}, retried: {retried}, failed: {failed}"
+    if delta:
+        summary += f", unchanged: {unchanged}"
+    print(f"✅ Upload complete! {summary}")
+    db.metrics.report()
+    if failed:
+        print("Rerun with --resume to retry failed batches")
+        sys.exit(1)
+
+# --- COPY bulk load ---
+# Structured columns are staged as jsonb and converted in the set-based
+# insert, so the CSV fed to COPY needs no Postgres array escaping.
+
+STAGING_TABLE = 'pois_staging'
+COPY_CHUNK_SIZE = 50_000
+PAYLOAD_COLUMNS = (
+    ['google_map_link', 'name', 'categories']
+    + TEXT_COLUMNS + INT_COLUMNS + FLOAT_COLUMNS + STRUCT_COLUMNS + BOOL_COLUMNS
+    + ['content_hash']
+)
+
+_BOOL_DDL = ",\n  ".join(f"{c} boolean" for c in BOOL_COLUMNS)
+
+# A temp table: private to the loading session (not exposed through
+# PostgREST, no clash between concurrent loads), never WAL-logged, and
+# dropped when the load transaction commits.
+STAGING_DDL = f"""
+DROP TABLE IF EXISTS public.{STAGING_TABLE};  -- permanent table used by older loaders
+CREATE TEMP TABLE {STAGING_TABLE} (
+  seq bigserial,
+  google_map_link text,
+  name text,
+  categories jsonb,
+  address text,
+  timezone text,
+  website text,
+  phone text,
+  descriptions text,
+  review_count integer,
+  review_rating numeric(2,1),
+  latitude double precision,
+  longitude double precision,
+  price_level numeric(2,1),
+  open_hours jsonb,
+  images jsonb,
+  complete_address jsonb,
+  {_BOOL_DDL},
+  content_hash text
+) ON COMMIT DROP;
+"""
+
+def _jsonb_text_array(col: str) -> str:
+    return (
+        f"CASE WHEN jsonb_typeof(s.{col}) = 'array' "
+        f"THEN ARRAY(SELECT jsonb_array_elements_text(s.{col})) END"
+    )
+
+_INSERT_SELECT = {
+    'categories': _jsonb_text_array('categories'),
+    'images': _jsonb_text_array('images'),
+}
+
+# Later rows win on duplicate links, as they would with successive REST upserts
+MERGE_SQL = f"""
+INSERT INTO pois ({', '.join(PAYLOAD_COLUMNS)})
+SELECT {', '.join(_INSERT_SELECT.get(c, f's.{c}') for c in PAYLOAD_COLUMNS)}
+FROM (
+  SELECT DISTINCT ON (google_map_link) *
+  FROM {STAGING_TABLE}
+  WHERE google_map_link IS NOT NULL
+  ORDER BY google_map_link, seq DESC
+) s
+ON CONFLICT (google_map_link) DO UPDATE
+SET {', '.join(f'{c} = EXCLUDED.{c}' for c in PAYLOAD_COLUMNS if c != 'google_map_link')},
+    missing_since = NULL
+"""
+
+# --delta: leave unchanged rows (and their triggers) alone
+MERGE_DELTA_WHERE = """
+WHERE pois.content_hash IS DISTINCT FROM EXCLUDED.content_hash
+   OR pois.missing_since IS NOT NULL
+"""
+
+PRUNE_SQL = {
+    'mark': f"""
+UPDATE pois p SET missing_since = now()
+WHERE p.missing_since IS NULL
+  AND NOT EXISTS (SELECT 1 FROM {STAGING_TABLE} s WHERE s.google_map_link = p.google_map_link)
+""",
+    'delete': f"""
+DELETE FROM pois p
+WHERE NOT EXISTS (SELECT 1 FROM {STAGING_TABLE} s WHERE s.google_map_link = p.google_map_link)
+""",
+}
+
+def _to_copy_csv(frame: pd.DataFrame) -> io.StringIO:
+    frame = frame[PAYLOAD_COLUMNS].copy()
+    for c in ['categories'] + STRUCT_COLUMNS:
+        frame[c] = frame[c].map(lambda v: None if v is None else json.dumps(v, ensure_ascii=False))
+    buf = io.StringIO()
+    frame.to_csv(buf, header=False, index=False)
+    buf.seek(0)
+    return buf
+
+def upload_copy(delta: bool = False, prune: str | None = None, defer_triggers: bool = False):
+    """
+    COPY poi.csv into a temp staging table, then merge into pois in one statement.
+
+    With ``defer_triggers`` the per-row geom/roles triggers are bypassed for
+    this transaction only (fika.defer_poi_triggers), and recompute_poi_derived()
+    fills geom and poi_roles for the merged rows in one set-based UPDATE.
+    Other sessions keep normal trigger behaviour throughout.
+    """
+    started = time.perf_counter()
+    with db.pg_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(STAGING_DDL)
+            total_rows = 0
+            for frame in iter_frames(batch_size=COPY_CHUNK_SIZE):
+                db.copy_from(cur, STAGING_TABLE, PAYLOAD_COLUMNS, _to_copy_csv(frame), rows=len(frame))
+                total_rows += len(frame)
+                print(f"Staged {total_rows} rows")
+
+            if defer_triggers:
+                cur.execute("SET LOCAL fika.defer_poi_triggers = 'on'")
+            db.timed(cur, 'merge pois', MERGE_SQL + (MERGE_DELTA_WHERE if delta else "") + " RETURNING id")
+            merged_ids = [r[0] for r in cur.fetchall()]
+            merged = len(merged_ids)
+            if defer_triggers:
+                t0 = time.perf_counter()
+                db.timed(cur, 'recompute_poi_derived', "SELECT recompute_poi_derived(%s::uuid[])", (merged_ids,))
+                cur.execute("SET LOCAL fika.defer_poi_triggers = 'off'")
+                print(f"Recomputed geom/poi_roles for {merged} rows in {time.perf_counter() - t0:.1f}s")
+            if prune:
+                pruned = db.timed(cur, f'prune pois ({prune})', PRUNE_SQL[prune])
+                print(f"Pruned ({prune}) {pruned} POIs missing from {CSV_PATH}")
+    db.close()
+
+    print(f"✅ COPY load complete! {total_rows} rows staged, {merged} upserted in {time.perf_counter() - started:.1f}s")
+    db.metrics.report()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Upload output/poi.csv into pois")
+    parser.add_argument("--copy", action="store_true",
+                        help="bulk load over a direct Postgres connection (COPY + one INSERT ... ON CONFLICT)")
+    parser.add_argument("--workers", type=int, default=WORKERS,
+                        help="concurrent REST upsert requests")
+    parser.add_argument("--resume", action="store_true",
+                        help=f"skip batches already recorded in {MANIFEST_PATH}")
+    parser.add_argument("--delta", action="store_true",
+                        help="only upsert rows whose content hash changed")
+    parser.add_argument("--prune", choices=PRUNE_MODES,
+                        help="mark (missing_since) or delete POIs that are no longer in the CSV")
+    parser.add_argument("--defer-triggers", action="store_true",
+                        help="with --copy: skip per-row geom/roles triggers and recompute them set-based after the merge")
+    args = parser.parse_args()
+    if args.prune and args.resume:
+        parser.error("--prune needs a full pass over the CSV; drop --resume")
+    if args.defer_triggers and not args.copy:
+        parser.error("--defer-triggers needs --copy (REST requests cannot share a session setting)")
+
+    if args.copy:
+        upload_copy(delta=args.delta, prune=args.prune, defer_triggers=args.defer_triggers)
+    else:
+        upload_rest(workers=args.workers, resume=args.resume, delta=args.delta, prune=args.prune)
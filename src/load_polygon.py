@@ -1,11 +1,16 @@
+import re
+import json
+import time
 import shutil
+import argparse
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 import osmnx as ox
-from supabase import create_client
-from dotenv import load_dotenv
 from shapely.geometry import Polygon, MultiPolygon, mapping
 
-load_dotenv()
-sb = create_client(__import__("os").environ["SUPABASE_URL"], __import__("os").environ["SUPABASE_KEY"])
+import db
 
 # Configure your regions here
 REGIONS = [
@@ -26,6 +31,14 @@ REGIONS = [
     },
 ]
 
+# Local boundary store: one GeoJSON Feature per geocoder query
+BOUNDARY_DIR = Path("data/boundaries")
+BOUNDARY_MAX_AGE_DAYS = 180
+# Nominatim allows 1 request/s in total. Requests go through one shared
+# limiter; extra workers only overlap parsing and saving.
+GEOCODE_WORKERS = 2
+GEOCODE_MIN_INTERVAL = 1.0  # seconds between Nominatim requests
+
 
 def to_multipolygon_geojson(gdf):
     geom = gdf.geometry.iloc[0]
@@ -34,48 +47,152 @@ def to_multipolygon_geojson(gdf):
     return mapping(geom)
 
 
-def upsert_area(name: str, country_iso2: str, kind: str, admin_level: int, geom_geojson: dict):
-    res = sb.rpc("rpc_upsert_admin_area_geojson", {
-        "p_name": name,
-        "p_country_iso2": country_iso2,
-        "p_kind": kind,
-        "p_admin_level": admin_level,
-        "p_parent_id": None,
-        "p_geom_geojson": geom_geojson,
-    }).execute()
-    return res.data
+def boundary_path(query: str) -> Path:
+    slug = re.sub(r"[^a-z0-9]+", "-", query.lower()).strip("-")
+    return BOUNDARY_DIR / f"{slug}.geojson"
 
 
-def fetch_and_upsert_country(name: str, iso2: str):
-    print(f"Fetching {name}...")
-    gdf = ox.geocode_to_gdf(name)
-    geom = to_multipolygon_geojson(gdf)
-    uid = upsert_area(name, iso2, "country", 2, geom)
-    print(f"✅ {name} id: {uid}")
-    return uid
+def load_boundary(query: str, max_age_days: float | None = BOUNDARY_MAX_AGE_DAYS):
+    """Stored MultiPolygon GeoJSON for a query, or None if missing/expired."""
+    path = boundary_path(query)
+    if not path.exists():
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        feature = json.load(f)
+    age_days = (time.time() - feature["properties"]["fetched_at"]) / 86400
+    if max_age_days is not None and age_days > max_age_days:
+        return None
+    return feature["geometry"]
+
+
+def save_boundary(query: str, geom_geojson: dict):
+    BOUNDARY_DIR.mkdir(parents=True, exist_ok=True)
+    path = boundary_path(query)
+    feature = {
+        "type": "Feature",
+        "properties": {"query": query, "fetched_at": int(time.time())},
+        "geometry": geom_geojson,
+    }
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(feature, f)
+    tmp.replace(path)
+
 
+_geocode_lock = threading.Lock()
+_last_geocode = 0.0
 
-def fetch_and_upsert_states(country: str, iso2: str, states: list[str]):
-    ok = fail = 0
-    for state in states:
+
+def geocode(query: str) -> dict:
+    global _last_geocode
+    # One request in flight, at least GEOCODE_MIN_INTERVAL apart, across threads
+    with _geocode_lock:
+        wait = _last_geocode + GEOCODE_MIN_INTERVAL - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
         try:
-            query = f"{state}, {country}"
-            print(f"  Fetching {state}...")
             gdf = ox.geocode_to_gdf(query)
-            geom = to_multipolygon_geojson(gdf)
-            upsert_area(state, iso2, "state", 4, geom)
-            ok += 1
-        except Exception as e:
-            print(f"  ✗ FAILED: {state} - {e}")
+        finally:
+            _last_geocode = time.monotonic()
+    geom = to_multipolygon_geojson(gdf)
+    save_boundary(query, geom)
+    return geom
+
+
+def resolve_boundaries(queries: list[str], offline: bool = False, refresh: bool = False):
+    """
+    Boundaries for each query from the local store, geocoding only what is
+    missing or expired (everything with ``refresh``) with bounded parallelism.
+
+    Returns (boundaries, errors), both keyed by query.
+    """
+    boundaries, errors, missing = {}, {}, []
+    for q in queries:
+        geom = None if refresh else load_boundary(q, None if offline else BOUNDARY_MAX_AGE_DAYS)
+        if geom is not None:
+            boundaries[q] = geom
+        elif offline:
+            errors[q] = f"not in {BOUNDARY_DIR} (offline)"
+        else:
+            missing.append(q)
+
+    print(f"Boundaries: {len(boundaries)} from store, {len(missing)} to geocode")
+    if missing:
+        with ThreadPoolExecutor(max_workers=GEOCODE_WORKERS) as pool:
+            futures = {pool.submit(geocode, q): q for q in missing}
+            for fut in as_completed(futures):
+                q = futures[fut]
+                try:
+                    boundaries[q] = fut.result()
+                    print(f"  Fetched {q}")
+                except Exception as e:
+                    errors[q] = str(e)
+        # osmnx's HTTP cache is redundant with the boundary store
+        shutil.rmtree("cache", ignore_errors=True)
+    return boundaries, errors
+
+
+def area_payload(name: str, iso2: str, kind: str, admin_level: int, geom_geojson: dict, parent: dict | None = None):
+    # Sent at full resolution: geom is what membership is tested against, and
+    # simplifying neighbours independently opens gaps and overlaps between
+    # them. The database derives its own bbox, simplified and tiled tiers.
+    return {
+        "name": name,
+        "country_iso2": iso2,
+        "kind": kind,
+        "admin_level": admin_level,
+        "geom": geom_geojson,
+        "parent": parent,
+    }
+
+
+def upsert_region(region: dict, boundaries: dict, errors: dict):
+    """Upsert a country and its states in one rpc_upsert_admin_areas_geojson call."""
+    country, iso2 = region["country"], region["iso2"]
+    parent_key = {"name": country, "country_iso2": iso2, "kind": "country"}
+
+    areas = []
+    if country in boundaries:
+        areas.append(area_payload(country, iso2, "country", 2, boundaries[country]))
+    else:
+        print(f"✗ FAILED: {country} - {errors.get(country, 'no boundary')}")
+
+    fail = 0
+    for state in region["states"]:
+        query = f"{state}, {country}"
+        if query not in boundaries:
+            print(f"  ✗ FAILED: {state} - {errors.get(query, 'no boundary')}")
             fail += 1
-    if states:
-        print(f"✅ {country} states: {ok}/{len(states)}")
+            continue
+        areas.append(area_payload(state, iso2, "state", 4, boundaries[query], parent_key))
+
+    if not areas:
+        return []
+    rows = db.rpc("rpc_upsert_admin_areas_geojson", {"p_areas": areas})
+    orphans = [r["name"] for r in rows if r["kind"] == "state" and r["parent_id"] is None]
+    print(f"✅ {country}: {len(rows)} areas upserted, {fail} failed")
+    if orphans:
+        print(f"  ⚠️  no parent resolved for: {', '.join(orphans)}")
+    return rows
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Upload admin area boundaries")
+    parser.add_argument("--offline", action="store_true",
+                        help=f"only use boundaries already in {BOUNDARY_DIR}, never geocode")
+    parser.add_argument("--refresh", action="store_true",
+                        help="geocode every region again, ignoring the store")
+    args = parser.parse_args()
+    if args.offline and args.refresh:
+        parser.error("--offline and --refresh are mutually exclusive")
+
+    queries = []
     for region in REGIONS:
-        fetch_and_upsert_country(region["country"], region["iso2"])
-        if region["states"]:
-            fetch_and_upsert_states(region["country"], region["iso2"], region["states"])
+        queries.append(region["country"])
+        queries += [f"{state}, {region['country']}" for state in region["states"]]
 
-    shutil.rmtree("cache", ignore_errors=True)
+    boundaries, errors = resolve_boundaries(queries, offline=args.offline, refresh=args.refresh)
+
+    for region in REGIONS:
+        upsert_region(region, boundaries, errors)
+    db.metrics.report()
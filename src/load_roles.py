@@ -1,8 +1,8 @@
 import os
 import glob
 import unicodedata
-from dotenv import load_dotenv
-from supabase import create_client
+import db
+from sync_mapping import sync_mapping
 
 TEXT_DIR = "data/text"
 SYNC_DELETE = False
@@ -23,8 +23,6 @@ def rows_for_file(path, role):
         raise ValueError(f"Invalid role: {role}")
     return [{"category": tok, "role": role} for tok in read_list(path)]
 
-load_dotenv()
-sb = create_client(os.environ["SUPABASE_URL"], os.environ["SUPABASE_KEY"])
 
 rows = []
 
@@ -52,29 +50,9 @@ pairs = sorted({(r["category"], r["role"]) for r in rows})
 payload = [{"category": c, "role": r} for (c, r) in pairs]
 print("to upsert:", len(payload))
 
-for i in range(0, len(payload), 1000):
-    chunk = payload[i:i+1000]
-    sb.table("category_role_map").upsert(chunk, on_conflict="category,role").execute()
-
-print("✅ done")
-
-if SYNC_DELETE:
-    cur = sb.table("category_role_map").select("category,role").execute().data
-    cur_pairs = {(r["category"], r["role"]) for r in cur}
-    desired = set(pairs)
-    stale = cur_pairs - desired
-    if stale:
-        print("removing stale rows:", len(stale))
-        stale_list = [{"category": c, "role": r} for (c, r) in stale]
-        for i in range(0, len(stale_list), 200):
-            batch = stale_list[i:i+200]
-            q = sb.table("category_role_map").delete()
-            for j, item in enumerate(batch):
-                if j == 0:
-                    q = q.eq("category", item["category"]).eq("role", item["role"])
-                else:
-                    q = q.or_(f"(category.eq.{item['category']},role.eq.{item['role']})")
-            q.execute()
-    print("sync-delete done (if enabled)")
+counts = sync_mapping("category_role_map", payload, delete=SYNC_DELETE)
+print(f"✅ done: {counts['added']} added, {counts['removed']} removed" + ("" if SYNC_DELETE else " (sync-delete disabled)"))
+print(f"poi_roles refreshed for {counts['pois_updated']} POIs")
 
 print("roles upload complete")
+db.metrics.report()
@@ -1,11 +1,9 @@
 import os
-from dotenv import load_dotenv
-from supabase import create_client
-
-load_dotenv()
-sb = create_client(os.environ["SUPABASE_URL"], os.environ["SUPABASE_KEY"])
+import db
+from sync_mapping import sync_mapping
 
 THEMES_DIR = "data/text/attractions"
+SYNC_DELETE = False
 
 THEME_KEYS = [
     "religious_sites",
@@ -37,8 +35,6 @@ pairs = {(r["theme"], r["category"]) for r in rows}
 rows = [{"theme": t, "category": c} for (t, c) in sorted(pairs)]
 print("to upsert:", len(rows))
 
-for i in range(0, len(rows), 1000):
-    chunk = rows[i:i+1000]
-    sb.table("theme_category_map").upsert(chunk, on_conflict="theme,category").execute()
-
-print("✅ done")
+counts = sync_mapping("theme_category_map", rows, delete=SYNC_DELETE)
+print(f"✅ done: {counts['added']} added, {counts['removed']} removed" + ("" if SYNC_DELETE else " (sync-delete disabled)"))
+db.metrics.report()
@@ -0,0 +1,14 @@
+import db
+
+
+def sync_mapping(table: str, rows: list[dict], delete: bool) -> dict:
+    """
+    Make a category mapping table (category_role_map, theme_category_map)
+    match ``rows`` with one rpc_sync_<table> call.
+
+    The server inserts missing rows and, with ``delete``, removes rows not in
+    ``rows``, in a single transaction. Returns the RPC's counts: ``added`` and
+    ``removed``, plus ``pois_updated`` for the role map.
+    """
+    data = db.rpc(f"rpc_sync_{table}", {"p_rows": rows, "p_delete": delete})
+    return data[0] if isinstance(data, list) else data
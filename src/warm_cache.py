@@ -0,0 +1,19 @@
+import argparse
+
+import db
+
+# Most-requested candidate parameter sets to rebuild after a load
+WARM_LIMIT = 50
+WARM_TTL_SECONDS = 86400
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild stale entries of the candidate result cache")
+    parser.add_argument("--limit", type=int, default=WARM_LIMIT,
+                        help="how many of the most-hit parameter sets to rebuild")
+    parser.add_argument("--ttl", type=int, default=WARM_TTL_SECONDS,
+                        help="lifetime of the rebuilt entries, in seconds")
+    args = parser.parse_args()
+
+    rebuilt = db.rpc("refresh_poi_candidate_cache", {"p_limit": args.limit, "p_ttl_seconds": args.ttl})
+    print(f"✅ Candidate cache warmed: {rebuilt} entries rebuilt")
+    db.metrics.report()